@@ -1,5 +1,8 @@
 from EvoAlign.chart import Chart
 from EvoAlign.align import Align
+from EvoAlign.archive import Archive
+from EvoAlign.scheduler import BanditScheduler, UniformScheduler
+from EvoAlign.convergence import Convergence
 from EvoAlign.evo import Evo
 from EvoAlign.amino import AminoAcid
 from EvoAlign.evo_align import EvoAlign
@@ -1,14 +1,21 @@
 """
 Currently meant to be a future replacement of Align class
 """
-from Bio import SeqIO
 import numpy as np
 import blosum as bl
 import random as rnd
-from math import floor
+import hashlib
+from math import ceil, floor, sqrt
+from statistics import NormalDist
+from EvoAlign.scoring import (ALPHABET, GAP, BlockProfile, encode, decode, dense_matrix, fixed_point, column_profile,
+                              pair_counts, row_pairs, pairs_total)
+from EvoAlign.smith_waterman import DELETION, INSERTION, MATCH, align_segments
+from EvoAlign import fasta, guide_tree
+
+# the traceback directions moved to smith_waterman, they stay importable from here for older code
+__all__ = ['Align', 'BLOSUM_MATRICES', 'DELETION', 'INSERTION', 'MATCH']
 
 
-DELETION, INSERTION, MATCH = range(3)
 BLOSUM_MATRICES = {45: bl.BLOSUM(45), 50: bl.BLOSUM(
     50), 62: bl.BLOSUM(62), 80: bl.BLOSUM(80), 90: bl.BLOSUM(90)}
 
@@ -16,71 +23,220 @@ BLOSUM_MATRICES = {45: bl.BLOSUM(45), 50: bl.BLOSUM(
 class Align():
 
     def __init__(self):
-        # Numpy array of character arrays (with trailing gaps)
-        self.seqs = []
+        # Read-only uint8 arrays of alphabet codes, one per sequence, shared with copies of this alignment
+        self.rows = []
+
+        # Alignment width, rows shorter than it end in implicit trailing gaps
+        self.width = 0
+
+        # All-gap columns dropped by compact(), still scored as if they were there
+        self.gap_columns = 0
+
+        # FASTA record ids of the rows (None: the rows are numbered)
+        self.ids = None
+
+        # 2D array of the padded rows, built on demand and decoded to characters only for output
+        self._seqs = None
+
+        # Content hashes of the rows (None until hashed), combined by digest()
+        self._digests = []
 
-    def _read_fasta(self, files):
+        # Cached column profile and its residue pair counts and totals, kept up to date by smith_waterman
+        self._profile = None
+        self._pairs = None
+        self._counts = None
+
+        # Edit made by smith_waterman without a cached profile, over the parent's exact counts (see estimate_scores)
+        self._edit = None
+
+        # Whether such edits left all-gap columns to drop once the alignment is counted again
+        self._uncompacted = False
+
+    def _read_fasta(self, files, mmap=None):
         """ Read in fasta file(s)
 
             Args:
-                files (str, list[str]): path to FASTA file or list of file paths
+                files (str, list[str]): path to FASTA file or list of file paths (plain or gzipped)
+                mmap (str): .npy file to memory map the encoded sequences from (default: None)
 
             Return:
-                self.seqs (list[ndarray]): list of amino acid sequence ndarrays
+                ids (list[str]): record ids of the sequences
+                seqs (ndarray): encoded sequences padded with trailing gaps to the longest one
+                lengths (list[int]): length of every sequence
+        """
+
+        # stream the records straight into one encoded buffer
+        return fasta.read(files, mmap)
+
+    def read_fasta(self, files, mmap=None):
+        """ User function to read in and format fasta files of amino acid sequences
+
+            Args:
+                files (str, list[str]): path to FASTA file or list of file paths (plain or gzipped)
+                mmap (str): .npy file to memory map the encoded sequences from, for large inputs (default: None)
         """
 
-        # recursively convert amino acid sequence to numpy character array for each sequence in fasta file
-        if type(files) == list:
-            fastas = [self._read_fasta(file) for file in files]
-            self.seqs = [seq for fasta in fastas for seq in fasta]
-            return self.seqs
+        # read in fasta file
+        ids, seqs, lengths = self._read_fasta(files, mmap)
+
+        # rows are views of the shared buffer and are never written to
+        seqs.flags.writeable = False
+        rows = [seq[:length] for seq, length in zip(seqs, lengths)]
+
+        # trailing gaps up to the longest sequence are implicit, the buffer already holds them
+        self.rows, self.width, self.ids = rows, seqs.shape[1], ids
+        self._digests = [None] * len(rows)
+        self.gap_columns = 0
+
+        # scores of the previous alignment no longer apply
+        self._seqs, self._profile, self._pairs, self._counts = seqs, None, None, None
+        self._edit = None
+
+    @property
+    def seqs(self):
+        """ Read-only 2D uint8 array of alphabet codes (with trailing gaps), built from the rows on first use """
+
+        if self._seqs is None:
+            seqs = np.full((len(self.rows), self.width), GAP, dtype=np.uint8)
+            for seq, row in zip(seqs, self.rows):
+                seq[:len(row)] = row
+            seqs.flags.writeable = False
+            self._seqs = seqs
+        return self._seqs
+
+    @seqs.setter
+    def seqs(self, seqs):
+        """ Replace the alignment with a 2D array of alphabet codes """
+
+        # copy so later edits of the given array can not reach rows shared with copies
+        seqs = np.array(seqs, dtype=np.uint8)
+        if seqs.ndim != 2:
+            seqs = seqs.reshape(len(seqs), 0)
+        seqs.flags.writeable = False
+        self.rows, self.width, self._seqs = list(seqs), seqs.shape[1], seqs
+        self._digests = [None] * len(seqs)
+        self._profile, self._pairs, self._counts = None, None, None
+        self._edit = None
+        self.gap_columns = 0
+
+        # record ids only carry over to the same number of rows
+        if self.ids is not None and len(self.ids) != len(seqs):
+            self.ids = None
+
+    def copy(self):
+        """ Copy-on-write copy sharing the read-only rows and cached profile with this alignment
 
-        # parse fasta file
-        fasta_sequences = SeqIO.parse(open(files), 'fasta')
+            Return:
+                copy (Align): alignment that can be mutated without affecting this one
+        """
 
-        # get list of individual string characters for each seq in file and convert to list
-        self.seqs = [list(str(fasta.seq)) for fasta in fasta_sequences]
+        copy = Align.__new__(Align)
+        copy.__dict__.update(self.__dict__)
 
-        # convert sequence strings to numpy character arrays
-        self.seqs = list(map(np.array, self.seqs))
+        # only the containers are copied, edits replace rows and profiles instead of writing into them
+        copy.rows, copy._digests = list(self.rows), list(self._digests)
+        return copy
 
-        # return seqs
-        return self.seqs
+    def digest(self):
+        """ Content hash (blake2b) of the alignment, hashing only the rows not hashed before
 
-    def _add_trailing(self):
-        """ Add trailing '*' characters to end of sequence arrays """
+            Return:
+                digest (str): hex digest, equal for alignments with the same width and rows up to trailing gaps
+        """
 
-        # get max length of sequences
-        max_seq = max([len(seq) for seq in self.seqs])
+        for idx, row in enumerate(self.rows):
+            if self._digests[idx] is None:
+                # trailing gaps are implicit, so they are left out of the row's hash
+                residues = np.flatnonzero(row != GAP)
+                row = row[:residues[-1] + 1 if len(residues) else 0]
+                self._digests[idx] = hashlib.blake2b(row.tobytes(), digest_size=16).digest()
 
-        # add trailing characters to arrays
-        self.seqs = [np.concatenate(
-            (seq, np.full(fill_value='*', shape=max_seq - len(seq)))) for seq in self.seqs]
+        return hashlib.blake2b(b''.join(self._digests) + self.width.to_bytes(8, 'little')
+                               + self.gap_columns.to_bytes(8, 'little'), digest_size=16).hexdigest()
 
-    def read_fasta(self, files):
-        """ User function to read in and format fasta files of amino acid sequences """
+    @staticmethod
+    def _segment(row, start, end):
+        """ Columns start:end of a stored row, with the implicit trailing gaps they cover """
 
-        # read in fasta file
-        self._read_fasta(files)
+        segment = row[start:end]
+        if len(segment) == end - start:
+            return segment
+        return np.concatenate((segment, np.full(end - start - len(segment), GAP, dtype=np.uint8)))
 
-        # add trailing sequences
-        self._add_trailing()
+    @staticmethod
+    def _splice(row, start, end, segment):
+        """ New row with columns start:end of a stored row replaced by segment, written into one
+        preallocated array; the implicit trailing gaps of the row stay implicit
+
+            Args:
+                row (ndarray): stored row (possibly shorter than the alignment)
+                start, end (int): columns replaced
+                segment (ndarray): their replacement
+
+            Return:
+                row (ndarray): the new row
+        """
 
-        # convert list of arrays to 2D ndarray
-        self.seqs = np.array(self.seqs)
+        prefix, suffix = row[:start], row[end:]
+        spliced = np.empty(start + len(segment) + len(suffix), dtype=np.uint8)
+        spliced[:len(prefix)] = prefix
+        spliced[len(prefix):start] = GAP
+        spliced[start:start + len(segment)] = segment
+        spliced[start + len(segment):] = suffix
+        return spliced
 
     def get_seqs(self):
         """ Retrieve array of sequences
 
             Return:
-                self.seqs (ndarray): array of amino acid sequence arrays
+                seqs (ndarray): array of amino acid sequence character arrays
+        """
+
+        return decode(self.seqs)
+
+    def to_strings(self):
+        """ Decode the alignment to one string per sequence
+
+            Return:
+                seqs (list[str]): aligned amino acid sequences (with trailing gaps)
         """
 
-        return self.seqs
+        return [''.join(seq) for seq in decode(self.seqs)]
+
+    def _pair_counts(self):
+        """ Residue pair counts and totals of the alignment, counted once and then kept up to date """
+
+        # count the residues in every column of the alignment once (unpickled counts come without a profile)
+        if self._pairs is None:
+            profile = column_profile(self.seqs)
+            self._pairs, self._counts = pair_counts(profile)
+            self._profile = BlockProfile.of(profile)
+
+            # columns dropped by compact() are gaps in every row
+            n = len(self.rows)
+            self._pairs[GAP, GAP] += self.gap_columns * n * n
+            self._counts[GAP] += self.gap_columns * n
+
+            # drop the columns left by edits made without a profile, the counts already include them
+            if self._uncompacted:
+                self._uncompacted = False
+                self.compact()
+        return self._pairs, self._counts
 
     def sum_pairs_score(self, matrix=bl.BLOSUM(62)):
         """ Calculates score across all columns for matches, mismatches, and gaps
 
+            The alignment is reduced to counts of the residue pairs sharing a column, which
+            are scored against the dense form of the matrix, so the cost does not grow with
+            the number of pairs. The counts are cached and shared by every matrix, and a child
+            made by smith_waterman updates them from its two edited rows only.
+
+            The total is exact (fixed point, see pairs_total) and rounded half to even. The
+            original pairwise loop summed floats, so a score landing exactly on .5 could round
+            either way with it: such scores can differ from it by 1 (e.g. its hydropathy
+            -628809.4999999997 rounded to -628809 where the exact -628809.5 rounds to -628810).
+            All other scores are the same integer.
+
             Args:
                 matrix (bl.BLOSUM matrix): BLOSUM matrix as eval system
 
@@ -88,37 +244,230 @@ class Align():
                 score (int): sum of pairs score for the fasta array
         """
 
-        # Initialize score
-        score = 0
+        # score the pair counts against the dense substitution matrix
+        dense = dense_matrix(matrix)
+        total = pairs_total(*self._pair_counts(), dense)
+
+        # convert from doubled fixed point units
+        return round(total / (2 * fixed_point(dense)[1]))
+
+    def sum_pairs_scores(self, matrices):
+        """ Sum of pairs scores under several matrices, all from one count of the alignment
+
+            Args:
+                matrices (list[dict]): scoring matrices such as bl.BLOSUM(62) or AminoAcid().volume_dict
+
+            Return:
+                scores (tuple[int]): sum of pairs score under every matrix
+        """
+
+        return tuple(self.sum_pairs_score(matrix) for matrix in matrices)
+
+    def estimate_scores(self, matrices, rate=0.05, confidence=0.99):
+        """ Estimate the sum of pairs scores of an edited alignment from a random sample of rows,
+        with a confidence bound
+
+            A child edited by smith_waterman without a cached profile (e.g. in a worker process)
+            keeps its parent's exact counts and its edit. Its score is the parent's score plus
+            the change of the pairs the two edited rows make: exact between the two of them and
+            estimated from a sample of the other rows against them. Each other row adds one
+            term, so by the central limit theorem the sum is within bound of the scaled sample
+            mean with the given confidence. The bound is only that normal approximation: with
+            about 30 sampled rows it covers the exact score less often than asked (about 0.88
+            of the time at a confidence of 0.9 on 120 rows). Alignments with exact counts, or
+            without an edit to estimate from, are scored exactly with zero bounds.
+
+            Args:
+                matrices (list[dict]): scoring matrices such as bl.BLOSUM(62) or AminoAcid().volume_dict
+                rate (float): fraction of the other rows sampled, at least 30 of them (default: 0.05)
+                confidence (float): two sided confidence of every bound (default: 0.99)
+
+            Return:
+                estimates (ndarray): estimated score under every matrix
+                bounds (ndarray): half width of the confidence interval of every estimate
+        """
+
+        # exact scores are cheap once counted, and the only option without an edit
+        others = len(self.rows) - 2
+        sample = min(others, max(30, ceil(rate * others)))
+        if self._pairs is not None or self._edit is None or sample == others:
+            return np.array(self.sum_pairs_scores(matrices), dtype=np.float64), np.zeros(len(matrices))
+
+        # the edited rows from the first changed column on, padded to the width like every other row
+        pairs, counts, edited, old_rows, start, width = self._edit
+        old1, old2 = (Align._segment(row, start, self.width) for row in old_rows)
+        new1, new2 = (Align._segment(self.rows[idx], start, self.width) for idx in edited)
+        rest = np.setdiff1d(np.arange(len(self.rows)), edited)
+        rows = np.stack([Align._segment(self.rows[idx], start, self.width)
+                         for idx in np.random.choice(rest, sample, replace=False)])
+
+        n, grow = len(self.rows), self.width - width
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        columns = np.arange(len(new1))
+        estimates, bounds = np.empty(len(matrices)), np.empty(len(matrices))
+        for idx, matrix in enumerate(matrices):
+            dense = dense_matrix(matrix)
+            sub, scale = fixed_point(dense)
+            both = sub + sub.T
+
+            # every pair is counted twice (see pairs_total): new columns of gaps, then the edited pair
+            total = pairs_total(pairs, counts, dense) + grow * n * (n - 1) * sub[GAP, GAP]
+            total += both[new1, new2].sum() - both[old1, old2].sum()
+
+            # change of every sampled row's pairs with the edited rows, scaled up to all the other rows
+            change = both[new1] + both[new2] - both[old1] - both[old2]
+            terms = change[columns, rows].sum(axis=1)
+            spread = terms.std(ddof=1) * sqrt((others - sample) / (others - 1)) / sqrt(sample)
+            estimates[idx] = (total + others * terms.mean()) / (2 * scale)
+            bounds[idx] = z * others * spread / (2 * scale)
+        return estimates, bounds
+
+    @staticmethod
+    def score_population(aligns, matrices):
+        """ Sum of pairs scores of many alignments under several matrices at once
+
+            The pair counts of the alignments are stacked into one (alignments x alphabet x
+            alphabet) tensor, so every matrix scores the whole population in one product.
+
+            Args:
+                aligns (list[Align]): alignments to score
+                matrices (list[dict]): scoring matrices
+
+            Return:
+                scores (ndarray): int64 scores (alignments x matrices)
+        """
+
+        counted = [align._pair_counts() for align in aligns]
+        pairs = np.stack([pairs for pairs, _ in counted]).reshape(-1, len(ALPHABET), len(ALPHABET))
+        counts = np.stack([counts for _, counts in counted]).reshape(-1, len(ALPHABET))
+
+        scores = np.empty((len(aligns), len(matrices)), dtype=np.int64)
+        for col, matrix in enumerate(matrices):
+            dense = dense_matrix(matrix)
+            scores[:, col] = np.round(pairs_total(pairs, counts, dense) / (2 * fixed_point(dense)[1]))
+        return scores
+
+    def _update_profile(self, old_rows, new_rows, new_width, start=0, stop=None):
+        """ Swap the contributions of edited rows in the cached profile and pair counts
+
+            Only the columns start to stop are recounted: the rows are unchanged before start,
+            and from stop on the edited rows are the same as before (or trailing gaps) in every
+            column, so their old and new pairs there cancel out. The profile is rebuilt only in
+            the blocks overlapping these columns (see BlockProfile).
+
+            Args:
+                old_rows (tuple[ndarray]): edited rows as they are stored (implicit trailing gaps)
+                new_rows (tuple[ndarray]): their replacements (implicit trailing gaps)
+                new_width (int): width of the alignment after the edit
+                start (int): first column the edit changed (default: 0)
+                stop (int): column after the last one the edit changed (default: new_width)
+        """
+
+        # nothing cached yet
+        if self._profile is None:
+            return
+
+        n, width = len(self.rows), self.width
+        stop = new_width if stop is None else min(stop, new_width)
+
+        # shrinking only happens when every row was edited, recount from scratch
+        if new_width < width:
+            self._profile, self._pairs, self._counts = None, None, None
+            return
+
+        # new columns are trailing gaps in every row
+        grow = new_width - width
+        pairs, counts = self._pairs.copy(), self._counts.copy()
+        pairs[GAP, GAP] += grow * n * n
+        counts[GAP] += grow * n
+
+        # take out the old rows, then add the new ones, counting each against the window of the profile
+        # that includes it; the window starts at a block so its whole blocks become the new profile's
+        start = start // BlockProfile.BLOCK * BlockProfile.BLOCK
+        window = self._profile.columns(start, stop, n)
+        columns = np.arange(stop - start)
+        for sign, rows in ((-1, old_rows), (1, new_rows)):
+            for row in rows:
+                row = Align._segment(row, start, stop)
+                if sign > 0:
+                    window[columns, row] += 1
+                row_counts = np.bincount(row, minlength=len(ALPHABET))
+                row_pair = row_pairs(window, row)
+                pairs += sign * (row_pair + row_pair.T - np.diag(row_counts))
+                counts += sign * row_counts
+                if sign < 0:
+                    window[columns, row] -= 1
+
+        self._profile, self._pairs, self._counts = self._profile.replace(start, window, new_width, n), pairs, counts
+
+    def compact(self, spans=None):
+        """ Drop the columns that are gaps in every row, including trailing padding no row needs
+
+            Gap columns still count towards the sum of pairs scores (BLOSUM scores '**' pairs),
+            so they are only removed from the stored alignment: gap_columns keeps their number
+            and every score stays the same. Scores, copies and pickles then no longer pay for them.
 
-        # Iterates through each position in the alignment
-        for pos in self.seqs.T[::-1]:
-            # use substition matrix to score matches and mismatches
-            score += sum([matrix[x + y] for i, x in enumerate(pos)
-                          for j, y in enumerate(pos) if i > j])
-        return round(score)
+            Args:
+                spans (list[tuple]): (start, stop) column ranges to look for all-gap columns in,
+                    e.g. the columns an edit changed (default: None, the whole alignment)
+
+            Return:
+                dropped (int): number of columns dropped
+        """
+
+        # the cached profile finds the all-gap columns without building the 2D array
+        n = len(self.rows)
+        drop = [np.zeros(0, dtype=np.int64)]
+        for lo, hi in spans if spans is not None else [(0, self.width)]:
+            hi = min(hi, self.width)
+            if self._profile is not None:
+                gaps = self._profile.gaps(lo, hi) == n
+            else:
+                gaps = ~(self.seqs[:, lo:hi] != GAP).any(axis=0)
+            drop.append(lo + np.flatnonzero(gaps))
+        drop = np.unique(np.concatenate(drop))
+        if len(drop) == 0:
+            return 0
+
+        # only the rows reaching past the first dropped column change, they end at their last residue
+        for idx, row in enumerate(self.rows):
+            if len(row) > drop[0]:
+                row = np.delete(row, drop[drop < len(row)])
+                residues = np.flatnonzero(row != GAP)
+                row = row[:residues[-1] + 1 if len(residues) else 0]
+                row.flags.writeable = False
+                self.rows[idx], self._digests[idx] = row, None
+        self.width -= len(drop)
+        self._seqs = None
+
+        # the pair counts already include the dropped columns, only the profile loses them
+        self.gap_columns += len(drop)
+        if self._profile is not None:
+            self._profile = self._profile.delete(drop, n)
+        return len(drop)
 
     @staticmethod
-    def _split_seqs(seq1, seq2, mod_len):
-        """ Helper function for splitting sequences into smaller chunk to align """
+    def _split_bounds(width, mod_len):
+        """ Helper function picking the columns of the chunk to align """
 
         # get max idx we can split seq from
-        max_idx = floor(len(seq1) - (mod_len * len(seq1)))
+        max_idx = floor(width - (mod_len * width))
 
         # start and end pos of seq chunk
         start = rnd.choice(range(max_idx + 1))
-        end = floor(start + (mod_len * len(seq1)))
-
-        # return part of seq1 to modify, part of seq2 to modify, start, end
-        return seq1[start:end], seq2[start:end], start, end
+        end = floor(start + (mod_len * width))
+        return start, end
 
 
     def smith_waterman(self, mod_len, insertion_penalty=-1, deletion_penalty=-1,
-                       mismatch_penalty=-1, match_score=2):
+                       mismatch_penalty=-1, match_score=2, matrix=None, band=None, max_cells=None,
+                       compact=True):
         """
         Find the optimum local sequence alignment for the sequences `seq1`\ 
         and `seq2` using the Smith-Waterman algorithm. Optional keyword\ 
-        arguments give the gap-scoring scheme. 
+        arguments give the gap-scoring scheme. The matrices are filled one\ 
+        row at a time by the vectorized kernel in EvoAlign.smith_waterman,\ 
+        optionally only within a band around the diagonal.
 
             Args:
                 mod_len (float): proportion of sequence to be modified by smith waterman
@@ -126,6 +475,16 @@ class Align():
                 deletion_penalty (int): penalty for a deletion (default: -1)
                 mismatch_penalty (int): penalty for a mismatch (default: -1)
                 match_score (int): score for a match (default: 2)
+                matrix (dict): substitution matrix such as bl.BLOSUM(62) used instead of\ 
+                    the match/mismatch scores (default: None)
+                band (int, str): fill only the cells within band of the diagonal, or 'auto' to\ 
+                    start narrow and widen the band as needed; much cheaper for long, closely\ 
+                    related segments (default: None, the full matrix)
+                max_cells (int): largest full traceback matrix kept in memory; larger segments are\ 
+                    aligned keeping about sqrt(m) rows instead, with the same result\ 
+                    (default: None, EvoAlign.smith_waterman.MAX_CELLS)
+                compact (bool): drop the columns the edit left as gaps in every row, see\ 
+                    compact() (default: True)
 
             Return:
                 self.seqs (list[ndarray]): list of amino acid sequence ndarrays
@@ -134,86 +493,114 @@ class Align():
                 https://stackoverflow.com/questions/12666494/how-do-i-decide-which-way-to-backtrack-in-the-smith-waterman-algorithm
 
         """
-        # get target variables from _two_rand_seqs() method
-        full_seq1, full_seq2, static_lst = self._two_rand_seqs()
-
-        # extract part of seqs to be modified
-        seq1, seq2, start, end = self._split_seqs(
-            full_seq1, full_seq2, mod_len)
-
-        # get the lengths
-        m, n = len(seq1), len(seq2)
-
-        # Construct the similarity matrix in p[i][j]
-        p = np.zeros((m + 1, n + 1))
-        q = np.zeros((m + 1, n + 1))
-        for i in range(1, m + 1):
-            for j in range(1, n + 1):
-                deletion = (p[i - 1][j] + deletion_penalty, DELETION)
-                insertion = (p[i][j - 1] + insertion_penalty, INSERTION)
-                if seq1[i - 1] == seq2[j - 1]:
-                    match = (p[i - 1][j - 1] + match_score, MATCH)
-                else:
-                    match = (p[i - 1][j - 1] + mismatch_penalty, MATCH)
-                p[i][j], q[i][j] = max((0, 0), deletion, insertion, match)
-
-        # Yield the aligned sequences one character at a time in reverse order
-        def backtrack():
-
-            i, j = m, n
-            while i > 0 and j > 0:
-                assert i >= 0 and j >= 0
-                if q[i][j] == MATCH:
-                    i -= 1
-                    j -= 1
-                    yield seq1[i], seq2[j]
-                elif q[i][j] == INSERTION:
-                    j -= 1
-                    yield '*', seq2[j]
-                elif q[i][j] == DELETION:
-                    i -= 1
-                    yield seq1[i], '*'
-                else:
-                    assert (False)
-
-        seq1_aligned, seq2_aligned = [
-            ''.join(reversed(s)) for s in zip(*backtrack())]
-
-        seq1_aligned = np.concatenate(
-            (full_seq1[:start], np.array(list(seq1_aligned)), full_seq1[end:]))
-        seq2_aligned = np.concatenate(
-            (full_seq2[:start], np.array(list(seq2_aligned)), full_seq2[end:]))
+        # get two random rows from _two_rand_seqs() method
+        idx1, idx2 = self._two_rand_seqs()
+        full_seq1, full_seq2 = self.rows[idx1], self.rows[idx2]
+
+        # extract part of seqs to be modified, only the segments are padded with their trailing gaps
+        start, end = self._split_bounds(self.width, mod_len)
+        seq1, seq2 = Align._segment(full_seq1, start, end), Align._segment(full_seq2, start, end)
+
+        # fill the similarity and traceback matrices and follow the traceback to get the aligned segments
+        seq1_aligned, seq2_aligned = align_segments(seq1, seq2, insertion_penalty, deletion_penalty,
+                                                    mismatch_penalty, match_score, matrix, band, max_cells)
+
+        # both rows shift by the same number of columns after the segment
+        grow = len(seq1_aligned) - (end - start)
+        width = self.width + (max(grow, 0) if len(self.rows) > 2 else grow)
+        seq1_aligned = Align._splice(full_seq1, start, end, seq1_aligned)
+        seq2_aligned = Align._splice(full_seq2, start, end, seq2_aligned)
+
+        # from stop on the edited rows keep their columns (the suffixes did not move) or are trailing gaps
+        stop = end if grow == 0 else max(len(full_seq1), len(full_seq2), len(seq1_aligned), len(seq2_aligned))
+
+        # rescore the two edited rows against the cached profile, or keep exact counts without a profile
+        # (unpickled) as the base of an estimate of the child's scores
+        if self._profile is None:
+            self._edit = ((self._pairs, self._counts, (idx1, idx2), (full_seq1, full_seq2), start, self.width)
+                          if self._pairs is not None else None)
+            self._pairs, self._counts = None, None
+        self._update_profile((full_seq1, full_seq2), (seq1_aligned, seq2_aligned), width, start, stop)
 
         # call _combine_again method to convert to full alignment
-        self._combine_again(seq1_aligned, seq2_aligned, static_lst=static_lst)
+        old_width = self.width
+        self._combine_again(idx1, idx2, seq1_aligned, seq2_aligned, width)
+
+        # checked on the cached profile in the columns the edit changed or added, only the rows reaching
+        # past a gap column are rebuilt; without a profile (e.g. in a worker process) the columns are
+        # dropped when the child is counted for its scores, after any estimate of the edit
+        if compact and self._profile is not None:
+            self.compact([(start, stop), (old_width, width)])
+        elif compact:
+            self._uncompacted = True
 
         # return self
         return self
 
+    def progressive(self, k=3, tree='upgma', matrix=bl.BLOSUM(62)):
+        """ Progressive alignment of the sequences (without their gaps) along a k-mer guide tree,
+        a seed for the evolution that is far closer to a good alignment than the padded input
+
+            Args:
+                k (int): k-mer length of the distances the guide tree is built from (default: 3)
+                tree (str): guide tree, 'upgma' or 'nj' for neighbor-joining (default: 'upgma')
+                matrix (dict): substitution dict the columns are aligned by (default: BLOSUM62)
+
+            Return:
+                seed (Align): new alignment of the same sequences with the same record ids
+        """
+
+        # one or no sequence is already aligned
+        seed = Align()
+        if len(self.rows) < 2:
+            seed.seqs = self.seqs
+        else:
+            merges = guide_tree.TREES[tree](guide_tree.kmer_distances(self.rows, k))
+            seed.seqs = guide_tree.progressive(self.rows, merges, matrix)
+        seed.ids = self.ids
+        return seed
+
     def _two_rand_seqs(self):
-        """ Finds two random sequences to align, saves the other sequences as a list of np.arrays """
+        """ Picks the indices of two random sequences to align, leaving the (possibly shared) rows untouched """
+
+        return rnd.sample(range(len(self.rows)), 2)
+
+    def _combine_again(self, idx1, idx2, seq1, seq2, width):
+        """ Puts the 2 new alignments in place of their rows, adjusting the width to the new length """
+
+        # the new rows replace entries of this alignment's own list, shared rows are never written to
+        for idx, seq in ((idx1, seq1), (idx2, seq2)):
+            seq.flags.writeable = False
+            self.rows[idx] = seq
+            self._digests[idx] = None
 
-        # Shuffle the current alignment
-        np.random.shuffle(self.seqs)
+        # rows that were not edited keep their trailing gaps, so the width only shrinks when all rows were edited
+        self.width = width
+        self._seqs = None
 
-        # Select 2 random sequences (first 2 because sequences were shuffled)
-        return self.seqs[0], self.seqs[1], [static for static in self.seqs[2:]]
+    def __getstate__(self):
+        """ Pickle the alignment, its record ids, dropped gap columns and exact pair counts, the profile is rebuilt on demand """
 
-    def _combine_again(self, seq1, seq2, static_lst):
-        """ Alters self.seqs to now contain the 2 new alignments and the static remainders, adjusted for new length """
+        # a memory mapped buffer is pickled as a plain array, the exact pair counts are small enough to keep
+        return {'seqs': np.asarray(self.seqs), 'ids': self.ids, 'gap_columns': self.gap_columns,
+                'pairs': self._pairs, 'counts': self._counts}
 
-        # first we place them all in the same list
-        static_lst.append(seq1)
-        static_lst.append(seq2)
+    def __setstate__(self, state):
+        """ Restore a pickled alignment, encoding '<U1' character arrays pickled by earlier versions """
 
-        # set list to self.seqs
-        self.seqs = static_lst
+        Align.__init__(self)
+        seqs = state['seqs']
+        if isinstance(seqs, np.ndarray) and seqs.dtype.kind == 'U':
+            seqs = encode(seqs)
+        self.seqs = seqs
+        self.ids = state.get('ids')
+        self.gap_columns = state.get('gap_columns', 0)
+        self._pairs, self._counts = state.get('pairs'), state.get('counts')
 
-        # add trailing sequences
-        self._add_trailing()
+    def __deepcopy__(self, memo):
+        """ Rows are read-only, so a deep copy can share them like copy() """
 
-        # convert list of arrays to 2D ndarray
-        self.seqs = np.array(self.seqs, dtype='<U1')
+        return self.copy()
 
     def __repr__(self):
-        return str(self.seqs)
\ No newline at end of file
+        return str(decode(self.seqs))
\ No newline at end of file
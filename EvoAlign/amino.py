@@ -1,19 +1,25 @@
-import pandas as pd
+import os
+import sys
+import json
+from functools import lru_cache
 from itertools import product
 from typing import NamedTuple
 
-# url to website scraped for hydropathy and volume data
+# url to website the hydropathy and volume data was scraped from
 url = 'https://www.imgt.org/IMGTeducation/Aide-memoire/_UK/aminoacids/IMGTclasses.html'
 
+# precomputed property values per amino acid, shipped with the package
+DATA = os.path.join(os.path.dirname(__file__), 'amino.json')
 
-def make_dict(df):
-    ''' Make scoring dictionary from given dataframe values '''
 
-    perms = [''.join(p) for p in product(list(df.columns), repeat=2)]
+def make_dict(values):
+    ''' Make scoring dictionary from given property values (amino acid -> value) '''
+
+    perms = [''.join(p) for p in product(list(values), repeat=2)]
     dct = {a_combo: 0 for a_combo in perms}
     for key in dct.keys():
         a1, a2 = key[0], key[1]
-        dct[key] = round(abs(float(df[a1]) - float(df[a2])) * -1, 2)
+        dct[key] = round(abs(float(values[a1]) - float(values[a2])) * -1, 2)
     return dct
 
 
@@ -27,15 +33,58 @@ def clean_df(df):
     return df
 
 
-# Make clean dfs for different properties
-df_hydropathy = clean_df(pd.read_html(url)[0])
-df_hydropathy.rename(columns={'W (1)': 'W'}, inplace=True)
+@lru_cache(maxsize=None)
+def load(path=DATA):
+    ''' Load the property values (read once, a few milliseconds with the tables built from them) '''
+
+    with open(path) as file:
+        return json.load(file)
+
+
+@lru_cache(maxsize=None)
+def tables():
+    ''' Scoring dictionaries and dense matrices (indexed like EvoAlign.scoring.ALPHABET) of both properties '''
+
+    from EvoAlign.scoring import dense_matrix
+
+    data = load()
+    dicts = {prop: make_dict(data[prop]) for prop in ('hydropathy', 'volume')}
+    return {prop: (dct, dense_matrix(dct)) for prop, dct in dicts.items()}
+
 
-df_volume = clean_df(pd.read_html(url)[1])
+def refresh(html, path=DATA):
+    ''' Regenerate the property values from a (local) copy of the IMGT amino acid classes page
+
+        Args:
+            html (str): path (or url) of the page
+            path (str): json file to write (default: the file shipped with the package)
+    '''
+
+    import pandas as pd
+
+    # Make clean dfs for different properties
+    df_hydropathy = clean_df(pd.read_html(html)[0])
+    df_hydropathy.rename(columns={'W (1)': 'W'}, inplace=True)
+    df_volume = clean_df(pd.read_html(html)[1])
+
+    data = {'source': url,
+            'hydropathy': {aa: float(df_hydropathy[aa].iloc[0]) for aa in df_hydropathy.columns},
+            'volume': {aa: float(df_volume[aa].iloc[0]) for aa in df_volume.columns}}
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=4)
+        file.write('\n')
+
+    # later loads see the new values, AminoAcid keeps the ones read at import
+    load.cache_clear()
+    tables.cache_clear()
 
 
 class AminoAcid(NamedTuple):
     """ NamedTuple of the hydropathy and volume scoring matrices """
 
-    hydropthy_dict: dict = make_dict(df_hydropathy)
-    volume_dict: dict = make_dict(df_volume)
+    hydropthy_dict: dict = tables()['hydropathy'][0]
+    volume_dict: dict = tables()['volume'][0]
+
+
+if __name__ == '__main__':
+    refresh(sys.argv[1])
@@ -0,0 +1,263 @@
+"""
+Pareto archive of non-dominated solutions with objectives kept in a NumPy matrix
+"""
+import numpy as np
+
+
+def dominated(objs, by=None):
+    """ Flag the rows of objs that are dominated by a row of by (default: by the other rows of objs)
+
+        A solution is dominated when another one scores strictly higher on every objective.
+
+        Args:
+            objs (ndarray): objective matrix (solutions x objectives)
+            by (ndarray): objective matrix of the candidate dominators (default: objs)
+
+        Return:
+            mask (ndarray): boolean mask of the dominated rows
+    """
+
+    by = objs if by is None else by
+    if len(objs) == 0 or len(by) == 0:
+        return np.zeros(len(objs), dtype=bool)
+
+    # compare in chunks so the broadcast stays small for large fronts
+    mask = np.empty(len(objs), dtype=bool)
+    chunk = max(1, 2 ** 20 // (len(by) * objs.shape[1]))
+    for start in range(0, len(objs), chunk):
+        block = objs[start:start + chunk]
+        mask[start:start + chunk] = (by[None, :, :] > block[:, None, :]).all(axis=2).any(axis=1)
+    return mask
+
+
+def nondominated(objs, block=256):
+    """ Indices of the non-dominated rows of objs (the first front of a non-dominated sort)
+
+        A dominator scores strictly higher on every objective, so it has a strictly larger
+        objective sum. Visiting the rows by decreasing sum, every row only has to be checked
+        against the front found so far and the rows of its own block.
+
+        Args:
+            objs (ndarray): objective matrix (solutions x objectives)
+            block (int): number of rows checked at a time
+
+        Return:
+            front (ndarray): sorted indices of the non-dominated rows
+    """
+
+    order = np.argsort(-objs.sum(axis=1), kind='stable')
+    front = np.empty(0, dtype=np.intp)
+    for start in range(0, len(order), block):
+        idx = order[start:start + block]
+        keep = ~(dominated(objs[idx], objs[front]) | dominated(objs[idx]))
+        front = np.concatenate((front, idx[keep]))
+    return np.sort(front)
+
+
+def crowding(objs):
+    """ Crowding distance of every row of objs (NSGA-II): the perimeter of the box spanned by its
+    neighbours on every objective, relative to the spread of that objective. The extremes of
+    every objective get an infinite distance, so they are always kept.
+
+        Args:
+            objs (ndarray): objective matrix (solutions x objectives)
+
+        Return:
+            distance (ndarray): float64 crowding distance of every row
+    """
+
+    distance = np.zeros(len(objs))
+    if len(objs) == 0:
+        return distance
+    for values in objs.T:
+        order = np.argsort(values, kind='stable')
+        span = values[order[-1]] - values[order[0]]
+        if span > 0 and len(order) > 2:
+            distance[order[1:-1]] += (values[order[2:]] - values[order[:-2]]) / span
+        distance[order[[0, -1]]] = np.inf
+    return distance
+
+
+def crowding_thin(objs, capacity):
+    """ Indices of at most capacity rows of objs keeping the spread of the front: the most crowded
+    rows are dropped, recomputing the distances as they go (half the excess at a time)
+
+        Args:
+            objs (ndarray): objective matrix (solutions x objectives)
+            capacity (int): number of rows kept
+
+        Return:
+            keep (ndarray): sorted indices of the rows kept
+    """
+
+    keep = np.arange(len(objs))
+    while len(keep) > capacity:
+        drop = max(1, (len(keep) - capacity) // 2)
+        order = np.argsort(crowding(objs[keep]), kind='stable')
+        keep = np.sort(np.delete(keep, order[:drop]))
+    return keep
+
+
+def epsilon_thin(objs, epsilon):
+    """ Indices of the rows of objs kept by an epsilon grid: objectives are bucketed in boxes of
+    size epsilon, every box keeps its row closest to its best corner, and boxes dominated by
+    another box are dropped (epsilon-dominance, Laumanns et al.)
+
+        Args:
+            objs (ndarray): objective matrix (solutions x objectives)
+            epsilon (float, ndarray): box size, one for all objectives or one per objective
+
+        Return:
+            keep (ndarray): sorted indices of the rows kept
+    """
+
+    if len(objs) == 0:
+        return np.arange(0)
+    scaled = objs / np.asarray(epsilon, dtype=np.float64)
+    boxes = np.floor(scaled)
+
+    # within a box the row with the largest sum of scaled objectives, the last one on ties
+    closeness = (scaled - boxes).sum(axis=1)
+    order = np.lexsort((-np.arange(len(objs)), -closeness))
+    _, first = np.unique(boxes[order], axis=0, return_index=True)
+    keep = order[first]
+
+    # boxes beaten on every objective by another box are dropped like dominated solutions
+    keep = keep[~dominated(boxes[keep])]
+    return np.sort(keep)
+
+
+class Archive:
+    """ Non-dominated solutions and their objectives, read like the old eval -> solution dict
+
+        Objectives are stored as a matrix (solutions x objectives) next to the list of
+        solutions, so dominance checks are vectorized. Evaluations are passed in and handed
+        out as ((obj1, score1), (obj2, score2), ...) tuples.
+    """
+
+    def __init__(self, capacity=None, epsilon=None):
+        """ Archive, optionally bounded
+
+            Args:
+                capacity (int): most solutions kept, the most crowded ones are evicted past it (default: None)
+                epsilon (float, list): box size of an epsilon grid keeping one solution per box,
+                    one for all objectives or one per objective (default: None)
+        """
+
+        # objective names, fixed by the first evaluation added
+        self.names = None
+        # objective matrix (solutions x objectives) and the solutions in the same order
+        self.objs = np.empty((0, 0))
+        self.sols = []
+
+        # bounds of the archive and the number of non-dominated solutions evicted to keep them
+        self.capacity = capacity
+        self.epsilon = epsilon
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.sols)
+
+    def _scores(self, eval):
+        """ Objective vector of an evaluation, fixing the objective names on first use """
+        names = tuple(name for name, _ in eval)
+        scores = np.array([score for _, score in eval])
+        if self.names is None:
+            self.names = names
+            self.objs = np.empty((0, len(names)), dtype=scores.dtype)
+        elif names != self.names:
+            raise ValueError(f'evaluation objectives {names} do not match the archive {self.names}')
+        return scores
+
+    def add(self, eval, sol):
+        """ Insert a solution unless a member dominates it, dropping the members it dominates
+
+            A solution with the same objectives as a member replaces it, like a dict key.
+
+            Args:
+                eval (tuple): ((obj1, score1), (obj2, score2), ...)
+                sol (object): the solution
+
+            Return:
+                added (bool): whether the solution entered the archive
+        """
+
+        scores = self._scores(eval)
+
+        # rejected in O(front size) when a member beats it on every objective
+        if (self.objs > scores).all(axis=1).any():
+            return False
+
+        # drop the members it beats on every objective or ties on all of them
+        keep = ~((scores > self.objs).all(axis=1) | (scores == self.objs).all(axis=1))
+        self.objs = np.vstack((self.objs[keep], scores))
+        self.sols = [s for s, k in zip(self.sols, keep) if k] + [sol]
+
+        # it may be the one evicted to stay within the bounds
+        return self._bound(new=len(self.sols) - 1)
+
+    def _bound(self, new=None):
+        """ Evict members past the epsilon grid and the capacity, counting them in evicted
+
+            Return:
+                kept (bool): whether the member at index new is still in the archive
+        """
+
+        keep = np.arange(len(self.sols))
+        if self.epsilon is not None:
+            keep = keep[epsilon_thin(self.objs, self.epsilon)]
+        if self.capacity is not None and len(keep) > self.capacity:
+            keep = keep[crowding_thin(self.objs[keep], self.capacity)]
+
+        kept = new is None or new in keep
+        if len(keep) < len(self.sols):
+            self.evicted += len(self.sols) - len(keep)
+            self.objs = self.objs[keep]
+            self.sols = [self.sols[i] for i in keep]
+        return bool(kept)
+
+    def merge(self, items):
+        """ Bulk insert (eval, solution) pairs, keeping only the non-dominated ones
+
+            Args:
+                items (iterable): (eval, solution) pairs, e.g. dict.items() or Archive.items()
+        """
+
+        items = list(items)
+        if not items:
+            return
+
+        # stack the new objectives under the current ones
+        scores = [self._scores(eval) for eval, _ in items]
+        objs = np.vstack([self.objs] + scores)
+        sols = self.sols + [sol for _, sol in items]
+
+        # identical objectives keep the last solution, as dict keys would
+        _, last = np.unique(objs[::-1], axis=0, return_index=True)
+        unique = np.sort(len(objs) - 1 - last)
+
+        # keep the first front of the remaining solutions
+        front = unique[nondominated(objs[unique])]
+        self.objs = objs[front]
+        self.sols = [sols[i] for i in front]
+        self._bound()
+
+    def prune(self):
+        """ Drop dominated members, and evict past the bounds (only needed after editing objs and sols directly) """
+        front = nondominated(self.objs)
+        if len(front) < len(self.sols):
+            self.objs = self.objs[front]
+            self.sols = [self.sols[i] for i in front]
+        self._bound()
+
+    def keys(self):
+        """ Evaluations of the members: ((obj1, score1), (obj2, score2), ...) """
+        return [tuple(zip(self.names, scores)) for scores in self.objs.tolist()]
+
+    def values(self):
+        """ Solutions of the members """
+        return list(self.sols)
+
+    def items(self):
+        """ (evaluation, solution) pairs of the members """
+        return list(zip(self.keys(), self.sols))
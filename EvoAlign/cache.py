@@ -0,0 +1,54 @@
+"""
+Bounded LRU cache of fitness evaluations keyed by solution content hashes
+"""
+from collections import OrderedDict
+
+
+class FitnessCache:
+    """ Least recently used cache: solution hash -> evaluation
+
+        Solutions are hashed with their digest() method (Align.digest); solutions without
+        one are never cached.
+    """
+
+    def __init__(self, size=4096):
+        # maximum number of evaluations kept (0 disables the cache)
+        self.size = size
+        self.evals = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, sol):
+        """ Content hash of a solution, None when it can not be cached """
+        if self.size <= 0 or not hasattr(sol, 'digest'):
+            return None
+        return sol.digest()
+
+    def get(self, key):
+        """ Cached evaluation of a key (None on a miss), counting the hit or miss """
+        if key is None:
+            return None
+        eval = self.evals.get(key)
+        if eval is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.evals.move_to_end(key)
+        return eval
+
+    def put(self, key, eval):
+        """ Cache an evaluation, evicting the least recently used ones past the size """
+        if key is None:
+            return
+        self.evals[key] = eval
+        self.evals.move_to_end(key)
+        while len(self.evals) > self.size:
+            self.evals.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """ Hit, miss and eviction counts, hit rate and current number of entries """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'entries': len(self.evals)}
@@ -1,7 +1,4 @@
 import urllib.request as urlreq
-from dash import Dash, html
-import dash_bio as dashbio
-from Bio import SeqIO
 
 """ CURRENTLY NON-FUNCTIONAL """
 class Chart():
@@ -10,6 +7,10 @@ class Chart():
         pass
 
     def alignment_chart(self, filename=None):
+        # dash is only imported when a chart is made, it takes seconds to import
+        from dash import Dash, html
+        import dash_bio as dashbio
+
         app = Dash()
 
         fasta = urlreq.urlopen('https://git.io/alignment_viewer_p53.fasta').read().decode('utf-8')
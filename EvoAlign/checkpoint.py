@@ -0,0 +1,227 @@
+"""
+Append-only checkpoint store shared by the runs syncing through the same directory
+"""
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+import weakref
+from contextlib import contextmanager
+import numpy as np
+from EvoAlign.archive import dominated, nondominated
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks (Windows): index lines are still appended whole, writers are not serialized
+    fcntl = None
+
+
+class Checkpoint:
+    """ Directory of pickled solutions with a small JSON lines index of their evaluations
+
+        path/index.jsonl     one {"key": ..., "eval": [[obj1, score1], ...]} line per solution
+        path/solutions/      one pickle per solution, named by the hash of its contents
+        path/lock            lock file serializing writers (and compaction) across processes
+
+        Merging only reads the index, and only unpickles the solutions that would enter the
+        population. Saving only appends solutions the index does not already have.
+        Runs with other objectives can share the directory: every run only reads and
+        compares the entries scored on the same objective names as its population, and
+        a solution saved by runs on several objective sets has one line for each.
+    """
+
+    def __init__(self, path='checkpoint'):
+        self.path = path
+        self.index_path = os.path.join(path, 'index.jsonl')
+        self.sols_path = os.path.join(path, 'solutions')
+        os.makedirs(self.sols_path, exist_ok=True)
+
+        # keys of the solutions already saved or loaded by this process: solution -> key
+        self._keys = weakref.WeakKeyDictionary()
+
+    def _key(self, sol):
+        """ Key (hash of the pickle) of a solution and its pickle, None if it was hashed before """
+        try:
+            return self._keys[sol], None
+        except (KeyError, TypeError):
+            payload = pickle.dumps(sol, pickle.HIGHEST_PROTOCOL)
+            return hashlib.blake2b(payload, digest_size=16).hexdigest(), payload
+
+    def _remember(self, sol, key):
+        """ Skip hashing the solution again on the next save """
+        try:
+            self._keys[sol] = key
+        except TypeError:
+            pass
+
+    @contextmanager
+    def _lock(self, shared=False):
+        """ Hold the directory lock (shared for readers, exclusive for writers) """
+        with open(os.path.join(self.path, 'lock'), 'a') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        """ Keys and evaluations of the saved solutions grouped by their objective names:
+        names -> {key: eval} (the last line wins for a key repeated on the same objectives) """
+        groups = {}
+        if not os.path.exists(self.index_path):
+            return groups
+        with open(self.index_path) as file:
+            for line in file:
+                # a line cut short by a crashed writer is ignored
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                eval = tuple((name, score) for name, score in entry['eval'])
+                groups.setdefault(Checkpoint._names(eval), {})[entry['key']] = eval
+        return groups
+
+    @staticmethod
+    def _names(eval):
+        """ Objective names of an evaluation """
+        return tuple(name for name, _ in eval)
+
+    @staticmethod
+    def _line(key, eval):
+        """ Index line of a saved solution """
+        return json.dumps({'key': key, 'eval': eval}) + '\n'
+
+    @staticmethod
+    def _objs(evals):
+        """ Objective matrix of a list of evaluations """
+        return np.array([[score for _, score in eval] for eval in evals]).reshape(len(evals), -1)
+
+    def _write_atomic(self, path, data):
+        """ Write a file through a temporary file and rename, so readers never see it half written """
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def merge_into(self, archive, names=None):
+        """ Merge the saved solutions that are not dominated by the archive into it
+
+            Args:
+                archive (Archive): population to merge into
+                names (tuple[str]): objective names of the run, only entries scored on them are
+                    merged (default: None, the archive's; an empty archive then merges nothing)
+
+            Return:
+                loaded (int): number of solutions unpickled
+        """
+
+        # entries scored on other objectives (of other runs) can not be compared
+        names = tuple(names) if names is not None else archive.names
+        if names is None:
+            return 0
+        with self._lock(shared=True):
+            entries = self._read_index().get(names, {})
+        if not entries:
+            return 0
+
+        # decide from the objectives alone which saved solutions would survive the merge
+        keys, evals = list(entries.keys()), list(entries.values())
+        objs = self._objs(evals)
+        keep = np.zeros(len(keys), dtype=bool)
+        keep[nondominated(objs)] = True
+        if len(archive):
+            keep &= ~dominated(objs, archive.objs)
+
+        # unpickle only those
+        items = []
+        for n in np.flatnonzero(keep):
+            try:
+                with open(os.path.join(self.sols_path, keys[n] + '.pkl'), 'rb') as file:
+                    sol = pickle.load(file)
+            except FileNotFoundError:
+                # compacted away by another run since the index was read
+                continue
+            self._remember(sol, keys[n])
+            items.append((evals[n], sol))
+        archive.merge(items)
+        return len(items)
+
+    def save(self, archive):
+        """ Append the archive's solutions that are new and not dominated by the saved ones
+
+            Args:
+                archive (Archive): population to save
+
+            Return:
+                saved (int): number of solutions appended
+        """
+
+        # hash the pickles of the solutions this process has not seen yet
+        hashed = [self._key(sol) for sol in archive.values()]
+        keys = [key for key, _ in hashed]
+        for sol, key in zip(archive.values(), keys):
+            self._remember(sol, key)
+
+        # only the entries on the archive's objectives count, other runs may have saved the same solutions
+        with self._lock():
+            entries = self._read_index().get(archive.names, {})
+            new = [n for n, key in enumerate(keys) if key not in entries]
+
+            # skip solutions a saved one already dominates
+            if new and entries:
+                saved = self._objs(list(entries.values()))
+                new = [n for n, is_dominated in zip(new, dominated(archive.objs[new], saved)) if not is_dominated]
+            if not new:
+                return 0
+
+            # solution files first, so every indexed key has its file
+            evals = archive.keys()
+            for n in new:
+                payload = hashed[n][1] or pickle.dumps(archive.sols[n], pickle.HIGHEST_PROTOCOL)
+                self._write_atomic(os.path.join(self.sols_path, keys[n] + '.pkl'), payload)
+
+            # then one append of all the new index lines
+            lines = ''.join(Checkpoint._line(keys[n], evals[n]) for n in new)
+            with open(self.index_path, 'ab+') as file:
+                # end a line cut short by a crashed writer so it can not swallow the first new one
+                if file.seek(0, os.SEEK_END) > 0:
+                    file.seek(-1, os.SEEK_END)
+                    if file.read(1) != b'\n':
+                        lines = '\n' + lines
+                file.write(lines.encode())
+                file.flush()
+                os.fsync(file.fileno())
+
+            # rewrite the index once dominated entries outnumber the front
+            if len(entries) + len(new) > 2 * len(archive) + 64:
+                self._compact()
+        return len(new)
+
+    def _compact(self):
+        """ Drop dominated entries from the index and their solution files (called holding the lock) """
+        # the front of every objective set is kept
+        lines, kept, listed = [], set(), set()
+        for entries in self._read_index().values():
+            keys, evals = list(entries.keys()), list(entries.values())
+            listed.update(keys)
+            for n in nondominated(self._objs(evals)).tolist():
+                lines.append(Checkpoint._line(keys[n], evals[n]))
+                kept.add(keys[n])
+
+        # swap in the smaller index before removing any file it no longer lists (a file is
+        # shared by the entries of the same solution on several objective sets)
+        self._write_atomic(self.index_path, ''.join(lines).encode())
+        for key in listed - kept:
+            try:
+                os.remove(os.path.join(self.sols_path, key + '.pkl'))
+            except FileNotFoundError:
+                pass
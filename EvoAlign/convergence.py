@@ -0,0 +1,177 @@
+"""
+Convergence of the Pareto front: hypervolume and epsilon indicators and the early stopping rule of Evo
+"""
+from bisect import bisect_left
+import numpy as np
+
+
+def _area(xs, ys):
+    """ Area dominated by a 2D staircase (xs ascending, ys descending) above the origin """
+    area, prev = 0.0, 0.0
+    for x, y in zip(reversed(xs), reversed(ys)):
+        area += x * (y - prev)
+        prev = y
+    return area
+
+
+def _insert(xs, ys, x, y):
+    """ Insert a point into a 2D staircase (xs ascending, ys descending) in place
+
+        Return:
+            changed (bool): False when a point of the staircase already dominates it
+    """
+
+    # the first point at or right of x is the highest of them
+    idx = bisect_left(xs, x)
+    if idx < len(xs) and ys[idx] >= y:
+        return False
+
+    # drop the points at x and left of it that the new one covers
+    start, end = idx, idx + (idx < len(xs) and xs[idx] == x)
+    while start > 0 and ys[start - 1] <= y:
+        start -= 1
+    xs[start:end], ys[start:end] = [x], [y]
+    return True
+
+
+def hypervolume(objs, ref):
+    """ Hypervolume of a front of maximized objectives: the volume it dominates above a reference point
+
+        Three objectives are swept by decreasing third objective, inserting every point into
+        the 2D staircase of the first two and updating its area only when it changed
+        (O(n^2) at worst, about n log n for typical fronts). More objectives are sliced the
+        same way down to three. Points not above ref on every objective add nothing.
+
+        Args:
+            objs (ndarray): objective matrix (solutions x objectives)
+            ref (ndarray): reference point (objectives), worse than the front on every objective
+
+        Return:
+            volume (float): dominated hypervolume
+    """
+
+    points = np.asarray(objs, dtype=np.float64) - np.asarray(ref, dtype=np.float64)
+    points = points[(points > 0).all(axis=1)]
+    if len(points) == 0:
+        return 0.0
+    if points.shape[1] == 1:
+        return float(points.max())
+    if points.shape[1] == 2:
+        order = np.lexsort((-points[:, 1], points[:, 0]))
+        xs, ys = [], []
+        for x, y in points[order].tolist():
+            _insert(xs, ys, x, y)
+        return _area(xs, ys)
+
+    # slice along the last objective, from the best point down to the reference
+    points = points[np.argsort(-points[:, -1], kind='stable')]
+    depths = np.append(points[1:, -1], 0.0)
+    volume = 0.0
+    if points.shape[1] == 3:
+        xs, ys, area = [], [], 0.0
+        for (x, y, z), depth in zip(points.tolist(), depths.tolist()):
+            if _insert(xs, ys, x, y):
+                area = _area(xs, ys)
+            volume += area * (z - depth)
+    else:
+        for idx, depth in enumerate(depths.tolist()):
+            volume += hypervolume(points[:idx + 1, :-1], np.zeros(points.shape[1] - 1)) * (points[idx, -1] - depth)
+    return volume
+
+
+def epsilon(old, new, scale):
+    """ Additive epsilon indicator of a new front over an old one: how far (in units of scale) the
+    old front has to move on every objective to weakly dominate every new point
+
+        Args:
+            old (ndarray): objective matrix of the earlier front (solutions x objectives)
+            new (ndarray): objective matrix of the current front (solutions x objectives)
+            scale (ndarray): unit of every objective, e.g. the spread of the front
+
+        Return:
+            eps (float): 0 or less when the new front is no better than the old one
+    """
+
+    if len(old) == 0 or len(new) == 0:
+        return np.inf if len(new) else 0.0
+
+    # for every new point, the old point closest to covering it
+    gaps = (new[:, None, :] - old[None, :, :]) / scale
+    return float(gaps.max(axis=2).min(axis=1).max())
+
+
+class Convergence:
+    """ Stop Evo.evolve when the Pareto front stopped improving over a sliding window of checks
+
+        Every check (each dom generations of evolve) records the front. The run has converged
+        when the front of window checks ago is almost as good as the current one:
+
+            'hypervolume'   relative hypervolume gain (new - old) / new below tol, measured
+                            from a reference point fixed at the first check just below its front
+            'epsilon'       epsilon indicator of the current front over the old one below tol,
+                            in units of the current spread of every objective
+    """
+
+    def __init__(self, window=10, tol=1e-3, indicator='hypervolume'):
+        if indicator not in ('hypervolume', 'epsilon'):
+            raise ValueError(f"unknown indicator {indicator!r}, use 'hypervolume' or 'epsilon'")
+        self.window = window
+        self.tol = tol
+        self.indicator = indicator
+
+        # reference point of the hypervolume, fixed by the first check
+        self.ref = None
+
+        # fronts (or their hypervolumes) of the last window + 1 checks, and the last improvement measured
+        self.history = []
+        self.improvement = None
+
+    @staticmethod
+    def reference(objs):
+        """ Reference point just below a front: its worst values less a tenth of its spread (or of their size) """
+
+        nadir = objs.min(axis=0)
+        margin = np.maximum(objs.max(axis=0) - nadir, np.maximum(np.abs(nadir), 1.0))
+        return nadir - 0.1 * margin
+
+    def check(self, objs):
+        """ Record the current front and decide whether the run has converged
+
+            Args:
+                objs (ndarray): objective matrix of the front (solutions x objectives)
+
+            Return:
+                converged (bool): whether the front improved by less than tol over the window
+        """
+
+        objs = np.asarray(objs, dtype=np.float64)
+        if len(objs) == 0:
+            return False
+
+        if self.indicator == 'hypervolume':
+            if self.ref is None:
+                self.ref = Convergence.reference(objs)
+            self.history.append(hypervolume(objs, self.ref))
+        else:
+            self.history.append(objs)
+        self.history = self.history[-(self.window + 1):]
+
+        # wait for a full window
+        if len(self.history) <= self.window:
+            return False
+
+        old, new = self.history[0], self.history[-1]
+        if self.indicator == 'hypervolume':
+            self.improvement = (new - old) / new if new > 0 else 0.0
+        else:
+            spread = new.max(axis=0) - new.min(axis=0)
+            self.improvement = epsilon(old, new, np.where(spread > 0, spread, np.maximum(np.abs(new.max(axis=0)), 1.0)))
+        return self.improvement < self.tol
+
+    def stats(self):
+        """ Last indicator value and improvement, for the metrics snapshots """
+
+        latest = self.history[-1] if self.history else None
+        return {'indicator': self.indicator,
+                'hypervolume': latest if self.indicator == 'hypervolume' else None,
+                'improvement': self.improvement}
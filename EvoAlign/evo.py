@@ -4,26 +4,168 @@ Created on Sun Nov  1 19:48:48 2020
 @file: evo_v4.py: An evolutionary computing framework (version 4)
 Assumes no Solutions class.
 """
+import os
+import time
 import pickle
 import random as rnd
-import copy
-from functools import reduce
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
+import multiprocessing
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from EvoAlign.archive import Archive
+from EvoAlign.checkpoint import Checkpoint
+from EvoAlign.cache import FitnessCache
+from EvoAlign.metrics import Metrics, sink
+from EvoAlign.scheduler import BanditScheduler
+
+
+# Registered agents and fitness functions of the Evo driving this worker process
+_WORKER = {}
+
+
+def _init_worker(agents, fitness):
+    """ Receive the registered agents and fitness functions once per worker process """
+    _WORKER['agents'] = agents
+    _WORKER['fitness'] = fitness
+
+
+class _GroupMember:
+    """ One objective of a group registered with Evo.add_fitness_group. Called alone it
+    scores the whole group and keeps its own score; _evaluate scores the group once """
+
+    def __init__(self, group, f, index, batch, estimate=None):
+        self.group = group  # name of the group, its objective names joined by '+'
+        self.f = f  # solution -> scores of every objective of the group
+        self.index = index  # position of this objective in the group's scores
+        self.batch = batch  # list of solutions -> (solutions x objectives) scores, or None
+        self.estimate = estimate  # (solution, rate, confidence) -> (estimates, bounds), or None
+
+    def __call__(self, sol):
+        return self.f(sol)[self.index]
+
+
+def _evaluate(fitness, sol):
+    """ Score a solution with every fitness function, timing each one (or each group)
+    Returns the evaluation ((obj1, score1), ...) and the seconds per objective or group """
+    eval, seconds, groups = [], {}, {}
+    for name, f in fitness.items():
+        start = time.perf_counter()
+        if isinstance(f, _GroupMember):
+            # the objectives of a group are all scored by its first one
+            if f.group not in groups:
+                groups[f.group] = f.f(sol)
+                seconds[f.group] = time.perf_counter() - start
+            eval.append((name, groups[f.group][f.index]))
+        else:
+            eval.append((name, f(sol)))
+            seconds[name] = time.perf_counter() - start
+    return tuple(eval), seconds
+
+
+def _screen(fitness, sol, front, rate, confidence):
+    """ Whether a solution is confidently dominated by the front, judged from estimated
+    upper bounds of its scores instead of exact ones. The confidence is split over the
+    objectives (Bonferroni), so all the bounds hold together with that confidence.
+    Objectives without an estimator can not be bounded, and nothing is screened out.
+    Returns None when every bound is zero: the estimator fell back to the exact scores
+    (e.g. of offspring with cached counts), so screening would not save an exact scoring """
+    if len(front) == 0:
+        return False
+    level = 1 - (1 - confidence) / len(fitness)
+    upper, groups, estimated = [], {}, False
+    for name, f in fitness.items():
+        if not isinstance(f, _GroupMember) or f.estimate is None:
+            return False
+        if f.group not in groups:
+            estimates, bounds = f.estimate(sol, rate, level)
+            groups[f.group] = np.asarray(estimates) + np.asarray(bounds)
+            estimated = estimated or bool(np.any(bounds))
+        upper.append(groups[f.group][f.index])
+    if not estimated:
+        return None
+
+    # the archive rejects solutions beaten on every objective by a member
+    return bool((front > np.array(upper)).all(axis=1).any())
+
+
+def _run_task(task):
+    """ Run one agent in a worker process and score the offspring
+    task = (agent name, shared memory block, [(start, end) of each pickled parent], seed,
+            None or (sampling rate, confidence, objective matrix of the front) to screen with)
+    Returns the evaluation (None when screened out), the offspring, the agent's seconds,
+    the seconds per objective and the seconds spent screening (None when not screened,
+    or when the estimates were exact scores) """
+    name, block, spans, seed, screen = task
+
+    # unpickle the parents from the batch's shared memory block
+    shm = shared_memory.SharedMemory(name=block)
+    try:
+        picks = [pickle.loads(shm.buf[start:end].tobytes()) for start, end in spans]
+    finally:
+        shm.close()
+
+    # seed both random generators so the offspring only depends on the task
+    rnd.seed(seed)
+    np.random.seed(seed)
+
+    op, _, _ = _WORKER['agents'][name]
+    start = time.perf_counter()
+    solution = op(picks)
+    seconds = time.perf_counter() - start
+
+    # offspring confidently dominated by the front are not scored exactly
+    screen_seconds = None
+    if screen is not None:
+        start = time.perf_counter()
+        dropped = _screen(_WORKER['fitness'], solution, screen[2], screen[0], screen[1])
+        screen_seconds = time.perf_counter() - start if dropped is not None else None
+        if dropped:
+            return None, None, seconds, {}, screen_seconds
+
+    eval, fitness_seconds = _evaluate(_WORKER['fitness'], solution)
+    return eval, solution, seconds, fitness_seconds, screen_seconds
+
+
+def _island(conn, island, gens, migrate, elite, dom, seed, options):
+    """ Body of one island process: evolve its own population, and every migrate generations
+    send a few random members of its front through conn and merge the migrants it gets back.
+    Finally sends its whole front and its metrics """
+    done = 0
+    while done < gens:
+        n = min(migrate, gens - done)
+        # the island's own random stream is seeded once, later epochs continue it
+        island.evolve(n, dom, status=None, checkpoint=None, seed=seed if done == 0 else None, **options)
+        done += n
+        if done < gens:
+            items = island.pop.items()
+            emigrants = rnd.sample(items, min(elite, len(items)))
+            conn.send((emigrants, island.pop.objs.max(axis=0).tolist() if len(items) else [], len(items)))
+            island._immigrate(conn.recv())
+    conn.send((island.pop.items(), island.metrics))
+    conn.close()
 
 
 class Evo:
 
-    def __init__(self):
-        """ Population constructor """
-        self.pop = {}  # The solution population eval -> solution
+    def __init__(self, cache_size=4096, scheduler=None, capacity=None, epsilon=None):
+        """ Population constructor
+        cache_size bounds the number of evaluations remembered by solution content (0 disables it)
+        scheduler picks the agent to run next (default: BanditScheduler(), favouring the
+        agents whose offspring enter the population most often per second)
+        capacity bounds the population: past it the most crowded solutions of the front
+        are evicted (crowding distance), keeping its spread (default: None, unbounded)
+        epsilon keeps one solution per box of an epsilon grid over the objectives, a
+        number for all of them or one per objective (default: None)
+        pop.evicted counts the non-dominated solutions evicted by either bound """
+        self.pop = Archive(capacity, epsilon)  # The non-dominated solutions, read like a dict eval -> solution
+        self.cache = FitnessCache(cache_size)  # Evaluations of solutions already added: hash -> eval
         self.fitness = {}  # Registered fitness functions: name -> objective function
-        # Registered agents:  name -> (operator, num_solutions_input)
+        # Registered agents:  name -> (operator, num_solutions_input, readonly)
         self.agents = {}
+        self.metrics = Metrics()  # Agent, objective, pruning and checkpoint counters
+        self.scheduler = scheduler or BanditScheduler()  # Picks the agents to run
+        self.stats = {}  # Population statistics reported at status ticks: name -> f(solutions)
 
     def size(self):
         """ The size of the current population """
@@ -35,90 +177,380 @@ class Evo:
         according to this objective """
         self.fitness[name] = f
 
-    def add_agent(self, name, op, k=1):
+    def add_fitness_group(self, names, f, batch=None, estimate=None):
+        """ Register several objectives scored together, e.g. from one shared
+        precomputation. f(sol) returns the scores of all the named objectives
+        in order, and is called once per solution for the whole group.
+        batch(sols), if given, returns the (solutions x objectives) scores of
+        a list of solutions at once and is used by add_solutions.
+        estimate(sol, rate, confidence), if given, returns cheap estimates of the
+        scores and the half widths of their confidence intervals, used to screen
+        out offspring before exact scoring (see evolve) """
+        group = '+'.join(names)
+        for index, name in enumerate(names):
+            self.fitness[name] = _GroupMember(group, f, index, batch, estimate)
+
+    def add_agent(self, name, op, k=1, readonly=False):
         """ Register a named agent with the population.
         The operator (op) function defines what the agent does.
-        k defines the number of solutions the agent operates on. """
-        self.agents[name] = (op, k)
+        k defines the number of solutions the agent operates on.
+        readonly agents get the parents themselves and must return a new
+        solution without modifying them (e.g. from Align.copy()); other
+        agents may modify the copies of the parents they are given.
+        Names must be unique, as agents are scheduled and measured by name. """
+        if name in self.agents:
+            raise ValueError(f'an agent named {name!r} is already registered')
+        self.agents[name] = (op, k, readonly)
+
+    def add_stat(self, name, f):
+        """ Register a population statistic: f(solutions) returns a number that
+        is reported in the status line and metrics snapshots (e.g. mean width) """
+        self.stats[name] = f
+
+    def add_hook(self, hook):
+        """ Register a callable receiving a metrics snapshot (dict) at every status
+        tick of evolve and at its end, e.g. EvoAlign.metrics.JsonlSink(path) """
+        self.metrics.hooks.append(hook)
 
     def add_solution(self, sol):
-        """ Add a solution to the population """
+        """ Add a solution to the population. A solution with the same content as one
+        added before was already evaluated and inserted (or dominated), so it is skipped.
+        Returns whether the solution entered the population """
+        key = self.cache.key(sol)
+        if self.cache.get(key) is not None:
+            return False
+
         # eval = ((obj1, score1), (obj2, score2).....)
-        eval = tuple((name, f(sol)) for name, f in self.fitness.items())
-        self.pop[eval] = sol
+        eval, seconds = _evaluate(self.fitness, sol)
+        for name, spent in seconds.items():
+            self.metrics.evaluation(name, spent)
+        self.cache.put(key, eval)
+        return self.pop.add(eval, sol)
+
+    def add_solutions(self, sols):
+        """ Add many solutions at once, e.g. seed alignments or solutions loaded from
+        files. Fitness groups with a batch function score all the new solutions in one
+        call. Returns the number of solutions scored """
+        # skip the solutions seen before, or twice in sols
+        new, keys, seen = [], [], set()
+        for sol in sols:
+            key = self.cache.key(sol)
+            if self.cache.get(key) is None and (key is None or key not in seen):
+                new.append(sol)
+                keys.append(key)
+                seen.add(key)
+        if not new:
+            return 0
+
+        # objectives without a batch function are scored one solution at a time
+        batched = {name: f for name, f in self.fitness.items()
+                   if isinstance(f, _GroupMember) and f.batch is not None}
+        scores = [{} for _ in new]
+        for sol, score in zip(new, scores):
+            eval, seconds = _evaluate({name: f for name, f in self.fitness.items() if name not in batched}, sol)
+            score.update(eval)
+            for name, spent in seconds.items():
+                self.metrics.evaluation(name, spent)
+
+        # the others once per group for all of them
+        groups = {}
+        for name, f in batched.items():
+            if f.group not in groups:
+                start = time.perf_counter()
+                groups[f.group] = np.asarray(f.batch(new)).tolist()
+                self.metrics.evaluation(f.group, time.perf_counter() - start)
+            for score, row in zip(scores, groups[f.group]):
+                score[name] = row[f.index]
 
-    def run_agent(self, name):
-        """ Invoke an agent against the population """
-        op, k = self.agents[name]
-        picks = self.get_random_solutions(k)
+        # eval = ((obj1, score1), (obj2, score2).....)
+        items = [(tuple((name, score[name]) for name in self.fitness), sol) for score, sol in zip(scores, new)]
+        for key, (eval, _) in zip(keys, items):
+            self.cache.put(key, eval)
+        self.pop.merge(items)
+        return len(items)
+
+    def run_agent(self, name, screen=None, confidence=0.99):
+        """ Invoke an agent against the population
+        screen is the sampling rate of the estimates offspring are screened with
+        before exact scoring (default: None, score every offspring exactly) """
+        op, k, readonly = self.agents[name]
+        picks = self.get_random_solutions(k, copy=not readonly)
+        start = time.perf_counter()
         new_solution = op(picks)
-        self.add_solution(new_solution)
+        seconds = time.perf_counter() - start
+
+        # offspring confidently dominated by the front are not scored exactly (offspring with
+        # cached counts are estimated by their exact scores, and only go through add_solution)
+        if screen is not None:
+            start = time.perf_counter()
+            dropped = _screen(self.fitness, new_solution, self.pop.objs, screen, confidence)
+            if dropped is not None:
+                self.metrics.screening(time.perf_counter() - start, dropped)
+            if dropped:
+                self._record(name, seconds, False)
+                return
+        self._record(name, seconds, self.add_solution(new_solution))
+
+    def _record(self, name, seconds, accepted):
+        """ Count a run of an agent in the metrics and tell the scheduler how it went """
+        self.metrics.agent(name, seconds, accepted)
+        self.scheduler.record(name, seconds, accepted)
+
+    def _run_batch(self, pool, agent_names, batch, screen=None, confidence=0.99):
+        """ Run a batch of agents in the worker processes and add their offspring """
+        # pick agents, parents and seeds here so the run only depends on the main random generator
+        solutions = tuple(self.pop.values())
+        jobs = []
+        for _ in range(batch):
+            name = self.scheduler.choose(agent_names)
+            _, k, _ = self.agents[name]
+            jobs.append((name, [rnd.randrange(len(solutions)) for _ in range(k)], rnd.getrandbits(32)))
+
+        # pickle every picked parent once into a shared memory block, tasks only carry offsets
+        picked = sorted({idx for _, parents, _ in jobs for idx in parents})
+        payloads = [pickle.dumps(solutions[idx], pickle.HIGHEST_PROTOCOL) for idx in picked]
+        offsets = np.cumsum([0] + [len(payload) for payload in payloads])
+        spans = {idx: (int(offsets[n]), int(offsets[n + 1])) for n, idx in enumerate(picked)}
+        shm = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]), 1))
+        try:
+            shm.buf[:offsets[-1]] = b''.join(payloads)
+            # the front at the start of the batch screens its offspring, its members only get better
+            front = (screen, confidence, self.pop.objs) if screen is not None else None
+            tasks = [(name, shm.name, [spans[idx] for idx in parents], seed, front) for name, parents, seed in jobs]
+
+            # offspring come back in submission order, the ones seen before are not inserted again
+            for (name, _, _), result in zip(jobs, pool.map(_run_task, tasks)):
+                eval, sol, seconds, fitness_seconds, screen_seconds = result
+                for fname, spent in fitness_seconds.items():
+                    self.metrics.evaluation(fname, spent)
+                if screen_seconds is not None:
+                    self.metrics.screening(screen_seconds, eval is None)
+                if eval is None:
+                    self._record(name, seconds, False)
+                    continue
+                key = self.cache.key(sol)
+                accepted = False
+                if self.cache.get(key) is None:
+                    accepted = self.pop.add(eval, sol)
+                    self.cache.put(key, eval)
+                self._record(name, seconds, accepted)
+        finally:
+            shm.close()
+            shm.unlink()
 
-    def evolve(self, gens=1, dom=100, status=100, sync=1000):
+    @staticmethod
+    def _due(i, n, every):
+        """ Whether any of the n iterations starting at i is a multiple of every """
+        return (-i) % every < n
+
+    def resume(self, checkpoint='checkpoint'):
+        """ Merge the non-dominated solutions saved in a checkpoint directory (or Checkpoint) into the population """
+        store = checkpoint if isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint)
+        with self.metrics.timer('checkpoint'):
+            store.merge_into(self.pop, tuple(self.fitness))
+
+    def _emit(self, generation, seconds, **state):
+        """ Pass a metrics snapshot of the run so far (and any extra state) to the hooks and return it """
+        best = dict(zip(self.pop.names, self.pop.objs.max(axis=0).tolist())) if self.size() else {}
+        return self.metrics.emit(generation=generation, seconds=seconds,
+                                 gens_per_second=generation / seconds if seconds else 0.0,
+                                 population=self.size(), evicted=self.pop.evicted, best=best, cache=self.cache.stats(),
+                                 scheduler=self.scheduler.stats(),
+                                 stats={name: f(self.pop.values()) for name, f in self.stats.items()}, **state)
+
+    def evolve(self, gens=1, dom=100, status=100, sync=1000, workers=None, batch=None, seed=None,
+               checkpoint='checkpoint', log=None, converge=None, budget=None, screen=None, confidence=0.99):
         """ Run n random agents (default=1)
         dom defines how often we remove dominated (unfit) solutions
-        status defines how often we display the current population """
+        status defines how often we print a one line summary of the run and pass a
+        metrics snapshot to the hooks (see add_hook); print(evo) shows the population
+        log is a .csv or .jsonl file the snapshots of this run are appended to
+        sync defines how often we merge with the solutions saved in the checkpoint
+        checkpoint is the directory (or Checkpoint) shared with other runs, None to
+        run alone. The first sync resumes from the solutions already saved there
+        workers runs the agents and fitness functions in that many processes, batch
+        agents at a time (default=workers, ignored without workers). Agents and fitness functions must then be
+        picklable (module level functions or static methods), and scripts need an
+        if __name__ == '__main__' guard on platforms that spawn processes.
+        seed makes the run reproducible, also across worker counts for the same batch, when
+        agents are picked by the UniformScheduler (the BanditScheduler learns from measured
+        times). A serial run (no workers) picks parents differently and repeats only itself
+        converge (a Convergence) stops the run early once the front stopped improving,
+        checked every dom generations; budget stops it after that many seconds.
+        screen is the sampling rate of the cheap estimates (e.g. 0.05 of the rows) every
+        offspring is screened with: when a member of the front beats the upper confidence
+        bounds (at confidence) of its estimates on every objective, it is dropped without
+        exact scoring. Offspring whose estimates are their exact scores (all bounds zero)
+        are not screened. Needs estimators on every objective (see add_fitness_group)
+        Returns why the run stopped: 'gens', 'converged' or 'budget' """
+
+        # seed the random generators used to pick agents and by the agents themselves
+        if seed is not None:
+            rnd.seed(seed)
+            np.random.seed(rnd.getrandbits(32))
 
         agent_names = list(self.agents.keys())
-        for i in range(gens):
-            pick = rnd.choice(agent_names)
-            self.run_agent(pick)
-
-            if i % sync == 0:
-                # merge the saved solutions into my populations
-                try:
-                    with open('solutions.dat', 'rb') as file:
-                        loaded = pickle.load(file)
-                        for eval, sol in loaded.items():
-                            self.pop[eval] = sol
-                except Exception as e:
-                    print(e)
-
-                # remove dominated
-                self.remove_dominated()
-
-                # resave the population back to disk
-                with open('solutions.dat', 'wb') as file:
-                    pickle.dump(self.pop, file)
-
-            if i % dom == 0:
-                self.remove_dominated()
-
-            if i % status == 0:
-                self.remove_dominated()
-                print("Iteration:", i)
-                print("Population size:", self.size())
-                print(self)
-
-        # Clean up the population
-        self.remove_dominated()
+        store = checkpoint if checkpoint is None or isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint)
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                   initargs=(self.agents, self.fitness)) if workers else None
+
+        # a serial run goes one agent at a time, batch only applies to worker processes
+        step = (batch or workers) if pool is not None else 1
+        hook = sink(log) if log is not None else None
+        if hook is not None:
+            self.add_hook(hook)
+        start = time.perf_counter()
+        reason, done = 'gens', gens
+        progress = (lambda: {'convergence': converge.stats()}) if converge is not None else dict
+
+        try:
+            for i in range(0, gens, step):
+                n = min(step, gens - i)
+                if pool is None:
+                    pick = self.scheduler.choose(agent_names)
+                    self.run_agent(pick, screen, confidence)
+                else:
+                    self._run_batch(pool, agent_names, n, screen, confidence)
+
+                if store is not None and Evo._due(i, n, sync):
+                    with self.metrics.timer('checkpoint'):
+                        # merge the saved solutions into my population
+                        store.merge_into(self.pop, tuple(self.fitness))
+
+                        # append my new non-dominated solutions to the checkpoint
+                        store.save(self.pop)
+
+                if Evo._due(i, n, dom):
+                    self.remove_dominated()
+                    if converge is not None:
+                        with self.metrics.timer('convergence'):
+                            if converge.check(self.pop.objs):
+                                reason = 'converged'
+
+                if status and Evo._due(i, n, status):
+                    self.remove_dominated()
+                    print(Metrics.summary(self._emit(i + n, time.perf_counter() - start, **progress())))
+
+                if budget is not None and time.perf_counter() - start >= budget:
+                    reason = 'budget'
+                if reason != 'gens':
+                    print(f'stopped at gen {i + n}: {reason}')
+                    done = i + n
+                    break
+
+            # Clean up the population and report the whole run
+            self.remove_dominated()
+            self._emit(done, time.perf_counter() - start, stop=reason, **progress())
+            return reason
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if hook is not None:
+                self.metrics.hooks.remove(hook)
+
+    def _immigrate(self, items):
+        """ Merge (eval, solution) pairs scored by another population with the same fitness criteria """
+        for eval, sol in items:
+            self.cache.put(self.cache.key(sol), eval)
+        self.pop.merge(items)
+
+    def islands(self, n=4, gens=1, migrate=100, elite=2, topology='ring', dom=100, status=1000, seed=None,
+                log=None, **options):
+        """ Evolve n independent copies of the population in their own processes (an island model)
+        n islands each run gens generations of their own, on their own random stream
+        every migrate generations each island sends elite random members of its front to the
+        next island (topology='ring') or to a random other one (topology='random'), through
+        pipes routed by this process, so islands never share files or whole populations
+        status defines how often (in generations) a one line summary of the islands is printed
+        seed makes the run reproducible when agents are picked by the UniformScheduler
+        log is a .csv or .jsonl file the final snapshot of the run is appended to
+        other options (e.g. screen, confidence) are passed to every island's evolve
+        The fronts of all islands are merged into this population at the end, and their
+        metrics into this one's. Agents and fitness functions must be picklable, as for workers """
+        if topology not in ('ring', 'random'):
+            raise ValueError(f"unknown topology {topology!r}, use 'ring' or 'random'")
+
+        # one seed per island, and one for the random topology, all drawn from the run's seed
+        router = rnd.Random(seed)
+        seeds = [router.getrandbits(32) if seed is not None else None for _ in range(n)]
+
+        # every island starts from a copy of this population, without its hooks
+        islands = []
+        for _ in range(n):
+            island = Evo(self.cache.size, deepcopy(self.scheduler), self.pop.capacity, self.pop.epsilon)
+            island.agents, island.fitness, island.stats = self.agents, self.fitness, self.stats
+            island.pop.merge(self.pop.items())
+            islands.append(island)
+
+        context = multiprocessing.get_context()
+        pipes = [context.Pipe() for _ in range(n)]
+        processes = [context.Process(target=_island, daemon=True,
+                                     args=(child, island, gens, migrate, elite, dom, island_seed, options))
+                     for (_, child), island, island_seed in zip(pipes, islands, seeds)]
+        start = time.perf_counter()
+        try:
+            for process, (_, child) in zip(processes, pipes):
+                process.start()
+                child.close()
+            conns = [conn for conn, _ in pipes]
+
+            # route the migrants of every epoch, the islands wait for theirs before going on
+            for done in range(migrate, gens, migrate):
+                messages = [conn.recv() for conn in conns]
+                incoming = [[] for _ in range(n)]
+                for idx, (emigrants, _, _) in enumerate(messages):
+                    if n > 1:
+                        dest = (idx + 1) % n if topology == 'ring' else router.choice(
+                            [other for other in range(n) if other != idx])
+                        incoming[dest] += emigrants
+                for conn, items in zip(conns, incoming):
+                    conn.send(items)
+
+                if status and Evo._due(done - migrate, migrate, status):
+                    fronts = [best for _, best, _ in messages if best]
+                    best = np.max(fronts, axis=0).tolist() if fronts else []
+                    print(f"gen {done} | {done * n / (time.perf_counter() - start):.1f} gen/s | "
+                          f"islands {n} | pop {'/'.join(str(size) for _, _, size in messages)} | max "
+                          + ' '.join(f'{name}={score:g}' for name, score in zip(self.pop.names or (), best)))
+
+            # merge the fronts and the metrics of all islands
+            for conn in conns:
+                items, metrics = conn.recv()
+                self._immigrate(items)
+                self.metrics.merge(metrics)
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
 
-    def get_random_solutions(self, k=1):
-        """ Pick k random solutions from the population """
+        self.remove_dominated()
+        hook = sink(log) if log is not None else None
+        if hook is not None:
+            self.add_hook(hook)
+        try:
+            self._emit(gens * n, time.perf_counter() - start, islands=n)
+        finally:
+            if hook is not None:
+                self.metrics.hooks.remove(hook)
+        return 'gens'
+
+    def get_random_solutions(self, k=1, copy=True):
+        """ Pick k random solutions from the population, as copies unless copy=False
+        (alignments share their read-only rows with their copies, so copying is cheap) """
         if self.size() == 0:
             return []
         else:
             solutions = tuple(self.pop.values())
-            return [copy.deepcopy(rnd.choice(solutions)) for _ in range(k)]
-
-    @staticmethod
-    def _dominates(p, q):
-        """ p = evaluation of solution: ((obj1, score1), (obj2, score2), ... )"""
-        pscores = [score for _, score in p]
-        qscores = [score for _, score in q]
-        score_diffs = list(map(lambda x, y: y - x, pscores, qscores))
-        min_diff = min(score_diffs)
-        max_diff = max(score_diffs)
-        return min_diff <= 0.0 and max_diff < 0.0
-
-    @staticmethod
-    def _reduce_nds(S, p):
-        return S - {q for q in S if Evo._dominates(p, q)}
+            picks = [rnd.choice(solutions) for _ in range(k)]
+            return [deepcopy(pick) for pick in picks] if copy else picks
 
     def remove_dominated(self):
-        """ Remove dominated solutions """
-        nds = reduce(Evo._reduce_nds, self.pop.keys(), self.pop.keys())
-        self.pop = {k: self.pop[k] for k in nds}
+        """ Remove dominated solutions. The archive already rejects them on insertion,
+        so this only prunes what was put into self.pop.objs and self.pop.sols directly """
+        with self.metrics.timer('prune'):
+            self.pop.prune()
 
     def __str__(self):
         """ Output the solutions in the population """
@@ -128,21 +560,34 @@ class Evo:
         return rslt
 
     def _data_to_df(self):
-        """ Convert fitness criteria and solutions to dict """
+        """ Convert the objective matrix of the population to a DataFrame, one column per fitness criterion """
+        import pandas as pd
+
+        # the archive's columns are in the order the criteria were added
+        if self.pop.names is None:
+            return pd.DataFrame(columns=list(self.fitness.keys()))
+        return pd.DataFrame(self.pop.objs, columns=list(self.pop.names))
 
-        # Gets a list of solutions and fitness criteria
-        solutions = list(self.pop.keys())
-        fitness = list(self.fitness.keys())
+    def ranked(self, rankings=[], k=None):
+        """ Indices of the population members from best to worst, comparing fitness criteria in order
+        of importance (ties on all of them put the most recently added member first)
 
-        # Creates a dictionary where key is criteria and value is score list
+            Args:
+                rankings (list[str]): fitness criteria from most to least important
+                    (default: all of them in the order they were added)
+                k (int): number of indices returned (default: None, all)
 
-        alignment_dict = {key: [[fit[1] for fit in val if fit[0] == key][0]
-                                for val in solutions]
-                          for key in fitness}
+            Return:
+                order (ndarray): indices into pop.objs and pop.sols
+        """
 
-        df = pd.DataFrame(alignment_dict)
+        names = list(self.pop.names or self.fitness.keys())
+        columns = [names.index(fit) for fit in (rankings or names)]
 
-        return df
+        # lexsort sorts by its last key first, every key is negated to sort from best to worst
+        n = len(self.pop)
+        order = np.lexsort([-np.arange(n)] + [-self.pop.objs[:, col] for col in reversed(columns)]) if n else np.arange(0)
+        return order[:k]
 
     # sree and john pls ignore this and do not delete for now
     def _get_str_alignment(self):
@@ -155,6 +600,9 @@ class Evo:
 
     def visualize(self, axes=(0, 1, 2)):
         """ Create two visualizations to show the tradeoffs between agents: 3D scatterplot and pairplot """
+        # plotting libraries are imported on first use, they are slow to import
+        import matplotlib.pyplot as plt
+        import seaborn as sns
 
         # plot 3D scatterplot and pairplot
         sns.set(style="darkgrid", font_scale=1.2)
@@ -190,26 +638,33 @@ class Evo:
         sns.pairplot(data=df)
         plt.savefig('pairplot.png')
 
-    def save_to_fasta(self, rankings=[]):
-        """ Save population solution to fasta file """
-
-        # create list of rankings for fitness criteria
-        if len(rankings) == 0:
-            fit_rank = list(range(len(self.fitness.keys())))
-        else:
-            fit_rank = [list(self.fitness.keys()).index(fit)
-                        for fit in rankings]
-
-        # population keys
-        sols = list(self.pop.keys())
-
-        # sort keys by score based on fitness criteria ranking
-        sols = sorted(sols, key=lambda x: [x[i][1] for i in fit_rank])[::-1]
-
-        # convert solution to list of strings
-        seqs = [''.join(seq) for seq in self.pop[sols[0]].seqs]
-
-        # write to fasta
-        records = (SeqRecord(Seq(seq), str(index))
-                   for index, seq in enumerate(seqs))
-        SeqIO.write(records, "aligned.fasta", "fasta")
+    def save_to_fasta(self, rankings=[], k=1, path='aligned.fasta'):
+        """ Save the top k population solutions to fasta files
+
+            Args:
+                rankings (list[str]): fitness criteria from most to least important, see ranked
+                k (int): number of solutions saved (default: 1)
+                path (str): fasta file of the best solution; with k > 1 the solution ranked r
+                    goes to name_r.ext instead, e.g. aligned_1.fasta (default: 'aligned.fasta')
+
+            Return:
+                paths (list[str]): files written, best solution first
+        """
+        from Bio import SeqIO
+        from Bio.Seq import Seq
+        from Bio.SeqRecord import SeqRecord
+
+        paths = []
+        root, ext = os.path.splitext(path)
+        for rank, idx in enumerate(self.ranked(rankings, k), start=1):
+            # decode solution to list of strings
+            sol = self.pop.sols[idx]
+            seqs = sol.to_strings()
+
+            # write to fasta under the ids read in, or numbered when there are none
+            ids = sol.ids or [str(index) for index in range(len(seqs))]
+            records = (SeqRecord(Seq(seq), name, description='')
+                       for name, seq in zip(ids, seqs))
+            paths.append(path if k == 1 else f'{root}_{rank}{ext}')
+            SeqIO.write(records, paths[-1], "fasta")
+        return paths
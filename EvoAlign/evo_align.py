@@ -1,14 +1,74 @@
-from EvoAlign import Align, Evo, AminoAcid
+from itertools import product
+from EvoAlign import Align, Evo, AminoAcid, UniformScheduler, front
 import blosum as bl
 
-MATRICES = {45: bl.BLOSUM(45), 50: bl.BLOSUM(50), 62: bl.BLOSUM(62), 80: bl.BLOSUM(80), 90: bl.BLOSUM(90), 'HYDRO': AminoAcid().hydropthy_dict, 'VOL': AminoAcid().volume_dict}
+AMINO = AminoAcid()
+MATRICES = {45: bl.BLOSUM(45), 50: bl.BLOSUM(50), 62: bl.BLOSUM(62), 80: bl.BLOSUM(80), 90: bl.BLOSUM(90), 'HYDRO': AMINO.hydropthy_dict, 'VOL': AMINO.volume_dict}
+
+# default fitness criteria: name -> key of MATRICES
+OBJECTIVES = {'blosum_62_score': 62, 'hydropathy_score': 'HYDRO', 'volume_score': 'VOL'}
+
+
+class SumOfPairs():
+    """ Sum of pairs scores of an alignment under several matrices, all from one count of its residue pairs """
+
+    def __init__(self, matrices):
+        self.matrices = tuple(matrices)
+
+    def __call__(self, curr_align):
+        """ Scores of one alignment (Align object) under every matrix """
+
+        return curr_align.sum_pairs_scores(self.matrices)
+
+    def batch(self, aligns):
+        """ Scores of a list of alignments (alignments x matrices) as one stacked product """
+
+        return Align.score_population(aligns, self.matrices)
+
+    def estimate(self, curr_align, rate, confidence):
+        """ Sampled scores of one alignment and their confidence bounds, see Align.estimate_scores """
+
+        return curr_align.estimate_scores(self.matrices, rate, confidence)
+
 
 class EvoAlign():
 
-    def __init__(self):
-        self.Evo = Evo()
+    def __init__(self, objectives=None, capacity=None, epsilon=None, scheduler=None):
+        """ Alignment environment
+
+            Args:
+                objectives (dict): fitness criteria, name -> key of MATRICES (e.g. 45) or a scoring dict.
+                    They are all scored from one count of the alignment, so adding matrices is cheap
+                    (default: BLOSUM62, hydropathy and volume)
+                capacity (int): most alignments kept in the population, the most crowded ones of the
+                    front are evicted past it (default: None, unbounded)
+                epsilon (float, list): keep one alignment per epsilon box of scores, for all objectives
+                    or one per objective, e.g. [100, 50, 1000] (default: None)
+                scheduler (BanditScheduler, UniformScheduler): picks the agent to run next (default: None,
+                    a BanditScheduler, and a UniformScheduler for runs given a seed so they repeat exactly)
+        """
+
+        self.Evo = Evo(scheduler=scheduler, capacity=capacity, epsilon=epsilon)
+        self.scheduler = scheduler
         self.Align = Align()
 
+        # register fitness criteria as one group sharing the alignment's pair counts
+        objectives = OBJECTIVES if objectives is None else objectives
+        scores = SumOfPairs(MATRICES[matrix] if not isinstance(matrix, dict) else matrix
+                            for matrix in objectives.values())
+        self.Evo.add_fitness_group(list(objectives), scores, batch=scores.batch, estimate=scores.estimate)
+
+        # add modification agents
+        self.Evo.add_agent('smith_waterman_half', EvoAlign.smith_waterman_half_align)
+        self.Evo.add_agent('smith_waterman_quarter', EvoAlign.smith_waterman_quarter_align)
+        self.Evo.add_agent('smith_waterman_eighth', EvoAlign.smith_waterman_eighth_align)
+        self.Evo.add_agent('smith_waterman_half_banded', EvoAlign.smith_waterman_half_banded_align)
+        self.Evo.add_agent('smith_waterman_whole_banded', EvoAlign.smith_waterman_whole_banded_align)
+
+        # report the alignment widths, kept down by the agents compacting away all-gap columns
+        self.Evo.add_stat('width', EvoAlign.mean_width)
+        self.Evo.add_stat('max_width', EvoAlign.max_width)
+
     @staticmethod
     def smith_waterman_half_align(curr_align):
         """ Takes the current alignment (Align object) and runs Smith-Waterman on half of two random sequences """
@@ -30,6 +90,32 @@ class EvoAlign():
         curr_align = curr_align[0]
         return curr_align.smith_waterman(0.125)
 
+    @staticmethod
+    def smith_waterman_half_banded_align(curr_align):
+        """ Takes the current alignment (Align object) and runs banded Smith-Waterman on half of two random sequences """
+
+        curr_align = curr_align[0]
+        return curr_align.smith_waterman(0.5, band='auto')
+
+    @staticmethod
+    def smith_waterman_whole_banded_align(curr_align):
+        """ Takes the current alignment (Align object) and runs banded Smith-Waterman on two whole random sequences """
+
+        curr_align = curr_align[0]
+        return curr_align.smith_waterman(1.0, band='auto')
+
+    @staticmethod
+    def mean_width(aligns):
+        """ Mean width of the alignments (Align objects) in the population """
+
+        return sum(align.width for align in aligns) / len(aligns) if aligns else 0
+
+    @staticmethod
+    def max_width(aligns):
+        """ Widest alignment (Align object) in the population """
+
+        return max((align.width for align in aligns), default=0)
+
     @staticmethod
     def blosum_62_score(curr_align):
         """ Evaluates the current alignment (Align object) with the BLOSUM62 matrix """
@@ -60,62 +146,133 @@ class EvoAlign():
 
         return curr_align.sum_pairs_score(matrix=MATRICES['VOL'])
 
-    def read_fasta(self, files):
+    def read_fasta(self, files, mmap=None):
         """ Read in fasta file(s)
 
             Args:
-                files (str, list[str]): path to FASTA file or list of file paths
+                files (str, list[str]): path to FASTA file or list of file paths (plain or gzipped)
+                mmap (str): .npy file to memory map the encoded sequences from (default: None)
 
             Return:
                 self.seqs (list[ndarray]): list of amino acid sequence ndarrays
         """
 
-        self.Align.read_fasta(files)
+        self.Align.read_fasta(files, mmap)
+
+    def seed_alignments(self, ks=(2, 3), trees=('upgma', 'nj'), matrices=(45, 62, 80)):
+        """ Progressive alignments of the sequences along k-mer guide trees, one for every
+        combination of k-mer length, tree and substitution matrix, so the population starts
+        from several different good alignments instead of only the padded input
+
+            Args:
+                ks (tuple[int]): k-mer lengths of the guide tree distances (default: 2 and 3)
+                trees (tuple[str]): guide trees, 'upgma' and/or 'nj' (default: both)
+                matrices (tuple): keys of MATRICES or scoring dicts to align the columns by; the
+                    property matrices have no positive scores and make poor seeds (default: BLOSUM45, 62 and 80)
+
+            Return:
+                seeds (list[Align]): the seed alignments
+        """
+
+        matrices = [MATRICES[matrix] if not isinstance(matrix, dict) else matrix for matrix in matrices]
+        return [self.Align.progressive(k, tree, matrix) for k, tree, matrix in product(ks, trees, matrices)]
 
-    def _run(self, gens=1000, dom=100, status=100):
-        """ Run the evolution of the solutions """
+    def _run(self, gens=1000, dom=100, status=100, workers=None, batch=None, seed=None, checkpoint=None,
+             log=None, seeds=False, converge=None, budget=None, screen=None, confidence=0.99, islands=None,
+             migrate=100, elite=2, topology='ring'):
+        """ Run the evolution of the solutions, returning why it stopped """
 
-        # register fitness criteria
-        self.Evo.add_fitness_criteria('blosum_62_score', EvoAlign.blosum_62_score)
-        self.Evo.add_fitness_criteria('hydropathy_score', EvoAlign.hydropathy_score)
-        self.Evo.add_fitness_criteria('volume_score', EvoAlign.volume_score)
+        # add initial solution, and the progressive seed alignments next to it
+        self.Evo.add_solutions([self.Align] + (self.seed_alignments() if seeds else []))
 
-        # add modification agent
-        self.Evo.add_agent('smith_waterman', EvoAlign.smith_waterman_half_align)
-        self.Evo.add_agent('smith_waterman', EvoAlign.smith_waterman_quarter_align)
-        self.Evo.add_agent('smith_waterman', EvoAlign.smith_waterman_eighth_align)
+        # the bandit learns from measured times, so a seeded run picks the agents uniformly to repeat exactly
+        bandit = self.Evo.scheduler
+        if seed is not None and self.scheduler is None:
+            self.Evo.scheduler = UniformScheduler()
 
-        # add initial solution
-        self.Evo.add_solution(self.Align)
+        try:
+            # independent populations in their own processes, exchanging a few solutions
+            if islands:
+                return self.Evo.islands(islands, gens, migrate, elite, topology, dom, status, seed, log=log,
+                                        screen=screen, confidence=confidence)
 
-        # evolve population
-        self.Evo.evolve(gens, dom, status)
+            # evolve population
+            return self.Evo.evolve(gens, dom, status, workers=workers, batch=batch, seed=seed,
+                                   checkpoint=checkpoint, log=log, converge=converge, budget=budget,
+                                   screen=screen, confidence=confidence)
+        finally:
+            self.Evo.scheduler = bandit
 
     def fitness_criteria(self):
         """ Show the fitness criteria used in evolution """
 
         print(list(self.Evo.fitness.keys()))
 
-    def save_alignment(self, rankings=[]):
-        """ Save a best alignment solution based on ranking of fitness criteria. The default order is BLOSUM62, Hydropathy, Volume
+    def save_alignment(self, rankings=[], k=1, path='aligned.fasta'):
+        """ Save the best alignment solutions based on ranking of fitness criteria. The default order is BLOSUM62, Hydropathy, Volume
 
             Args:
                 rankings = (list(str)): list of fitness criteria in order of importance to alignment (most important to least important)
+                k (int): number of alignments saved, the one ranked r goes to aligned_r.fasta when k > 1 (default: 1)
+                path (str): fasta file to save to (default: 'aligned.fasta')
+
+            Return:
+                paths (list[str]): files written, best alignment first
+        """
+
+        return self.Evo.save_to_fasta(rankings, k, path)
+
+    def export_front(self, path='front.npz'):
+        """ Save every alignment of the Pareto front and all their scores to one .npz file,
+        read back (memory mapped) with EvoAlign.front.load
+
+            Args:
+                path (str): .npz file to write (default: 'front.npz')
         """
-        
-        self.Evo.save_to_fasta(rankings)
 
-    def align(self, gens=1000, dom=100, status=100, show=False):
+        front.save(path, self.Evo.pop)
+
+    def align(self, gens=1000, dom=100, status=100, show=False, workers=None, batch=None, seed=None,
+              checkpoint=None, log=None, seeds=False, converge=None, budget=None, screen=None,
+              confidence=0.99, islands=None, migrate=100, elite=2, topology='ring'):
         """ Aligns given amino acid sequences
 
             Args:
                 gens (int): number of generations to evolve population
                 dom (int): frequency at which solutions are dominated
-                status (int): frequency at which the population is outputted
+                status (int): frequency at which a one line status of the run is printed
                 show (bool): should the visualizations of tradeoffs be made
+                workers (int): number of processes running agents in parallel (default: None, run serially)
+                batch (int): number of agents run per parallel step, only with workers (default: workers)
+                seed (int): seed for a reproducible run, also across worker counts for the same batch (a
+                    serial run differs from those); without a scheduler given to EvoAlign the agents are
+                    then picked uniformly (default: None)
+                checkpoint (str): directory shared with other runs to checkpoint and resume from, e.g. 'checkpoint'
+                    (default: None, no checkpoints)
+                log (str): .csv or .jsonl file the run metrics are appended to at every status (default: None)
+                seeds (bool): start from progressive guide tree alignments as well as the input,
+                    see seed_alignments (default: False)
+                converge (Convergence): stop early once the Pareto front stopped improving, checked
+                    every dom generations (default: None, run all gens)
+                budget (float): stop after this many seconds (default: None)
+                screen (float): fraction of the rows sampled to estimate the scores of offspring
+                    edited without cached counts (e.g. in worker processes); confidently dominated
+                    ones are dropped without exact scoring (default: None, score all exactly)
+                confidence (float): confidence of the screening bounds (default: 0.99)
+                islands (int): evolve that many independent populations in their own processes
+                    instead, see Evo.islands; workers, checkpoint, converge and budget do not
+                    apply to them (default: None)
+                migrate (int): generations between migrations of the islands (default: 100)
+                elite (int): solutions every island sends at a migration (default: 2)
+                topology (str): 'ring' or 'random' migration between the islands (default: 'ring')
+
+            Return:
+                reason (str): why the run stopped, 'gens', 'converged' or 'budget'
         """
 
-        self._run(gens, dom, status)
+        reason = self._run(gens, dom, status, workers, batch, seed, checkpoint, log, seeds, converge, budget,
+                           screen, confidence, islands, migrate, elite, topology)
 
         if show:
             self.Evo.visualize()
+        return reason
@@ -0,0 +1,109 @@
+"""
+Streaming FASTA reader encoding the residues straight into one preallocated alignment buffer
+"""
+import os
+import gzip
+import numpy as np
+from EvoAlign.scoring import GAP, encode
+
+
+# first two bytes of every gzip file
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_fasta(path):
+    """ Open a FASTA file for reading bytes, decompressing it on the fly when it is gzipped
+
+        Args:
+            path (str): path to a plain or gzipped FASTA file
+
+        Return:
+            file (file object): binary file positioned at the start of the FASTA text
+    """
+
+    # gzip is recognized by its magic bytes rather than by the file name
+    with open(path, 'rb') as file:
+        magic = file.read(2)
+    return gzip.open(path, 'rb') if magic == _GZIP_MAGIC else open(path, 'rb')
+
+
+def records(files):
+    """ Stream the records of one or more FASTA files, one record in memory at a time
+
+        Lines before the first header are skipped and whitespace inside sequence lines is
+        dropped. The id of a record is the first word of its header, like Bio.SeqIO.
+
+        Args:
+            files (str, list[str]): path to a FASTA file or list of paths (plain or gzipped)
+
+        Yield:
+            id (str): record id
+            lines (list[bytes]): sequence lines of the record without whitespace
+    """
+
+    # a single path is a list of one file
+    if isinstance(files, (str, bytes, os.PathLike)):
+        files = [files]
+
+    for path in files:
+        with open_fasta(path) as file:
+            name, lines = None, []
+            for line in file:
+                if line.startswith(b'>'):
+                    # a header ends the previous record
+                    if name is not None:
+                        yield name, lines
+                    words = line[1:].decode().split(None, 1)
+                    name, lines = words[0] if words else '', []
+                elif name is not None:
+                    lines.append(b''.join(line.split()))
+
+            # the last record ends with the file
+            if name is not None:
+                yield name, lines
+
+
+def read(files, mmap=None):
+    """ Read FASTA files into one 2D buffer of alphabet codes padded with trailing gaps
+
+        The files are streamed twice: once to size the buffer, once to encode every
+        record's lines directly into its row, so no per-residue Python objects are made.
+
+        Args:
+            files (str, list[str]): path to a FASTA file or list of paths (plain or gzipped)
+            mmap (str): .npy file to keep the buffer in as a read-only memory map (default: None, in memory)
+
+        Return:
+            ids (list[str]): record ids in file order
+            seqs (ndarray): uint8 buffer of alphabet codes (records x longest record)
+            lengths (list[int]): number of residues of every record
+    """
+
+    # first pass: record ids and lengths
+    ids, lengths = [], []
+    for name, lines in records(files):
+        ids.append(name)
+        lengths.append(sum(len(line) for line in lines))
+
+    # allocate the whole alignment once, every cell starting as a gap
+    shape = (len(ids), max(lengths, default=0))
+    if mmap is None:
+        seqs = np.full(shape, GAP, dtype=np.uint8)
+    else:
+        seqs = np.lib.format.open_memmap(mmap, mode='w+', dtype=np.uint8, shape=shape)
+        seqs[:] = GAP
+
+    # second pass: encode the lines of every record into its row
+    for seq, (_, lines) in zip(seqs, records(files)):
+        start = 0
+        for line in lines:
+            seq[start:start + len(line)] = encode(line)
+            start += len(line)
+
+    # reopen the written memory map read-only
+    if mmap is not None:
+        seqs.flush()
+        del seqs
+        seqs = np.load(mmap, mmap_mode='r')
+
+    return ids, seqs, lengths
@@ -0,0 +1,128 @@
+"""
+Columnar export of a Pareto front of alignments: one uncompressed .npz of objectives and encoded alignments,
+memory mapped member by member on read
+"""
+import struct
+import zipfile
+import numpy as np
+from EvoAlign.scoring import decode
+
+# fixed part of a zip local file header: signature, ..., file name length, extra field length
+_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+
+
+def save(path, archive):
+    """ Write every member of an archive of alignments to one .npz file of columns
+
+        names        objective names (objectives)
+        objs         objective matrix (alignments x objectives), rows in the archive's order
+        ids          FASTA record ids of the sequences (empty when they are numbered)
+        widths       width of every alignment
+        gap_columns  all-gap columns dropped from every alignment by Align.compact
+        offsets      start of every alignment in seqs (alignments + 1)
+        seqs         alphabet codes of all alignments, each one flattened row by row
+
+        The arrays are stored uncompressed, so load can memory map them.
+
+        Args:
+            path (str): .npz file to write
+            archive (Archive): population of Align solutions, e.g. Evo.pop
+    """
+
+    aligns = archive.sols
+    widths = np.array([align.width for align in aligns], dtype=np.int64)
+    rows = np.array([len(align.rows) for align in aligns], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(widths * rows)))
+
+    # every alignment's padded 2D array is copied once into the shared column
+    seqs = np.empty(offsets[-1], dtype=np.uint8)
+    for align, start, end in zip(aligns, offsets[:-1], offsets[1:]):
+        seqs[start:end] = np.asarray(align.seqs).ravel()
+
+    ids = next((align.ids for align in aligns if align.ids is not None), [])
+    np.savez(path, names=np.array(archive.names or (), dtype=str), objs=archive.objs,
+             ids=np.array(ids, dtype=str), widths=widths,
+             gap_columns=np.array([align.gap_columns for align in aligns], dtype=np.int64),
+             offsets=offsets, seqs=seqs)
+
+
+def _member(file, info, mmap):
+    """ Read one member of an .npz, memory mapped when it is stored uncompressed """
+
+    if not mmap or info.compress_type != zipfile.ZIP_STORED:
+        with zipfile.ZipFile(file.name) as archive, archive.open(info) as member:
+            return np.lib.format.read_array(member)
+
+    # the array data starts after the local file header and the .npy header
+    file.seek(info.header_offset)
+    fields = _LOCAL_HEADER.unpack(file.read(_LOCAL_HEADER.size))
+    file.seek(info.header_offset + _LOCAL_HEADER.size + fields[-2] + fields[-1])
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(file)
+    else:
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(file)
+
+    # an empty array can not be mapped
+    if np.prod(shape) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(file.name, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                     order='F' if fortran else 'C')
+
+
+class Front:
+    """ Pareto front read back from a file written by save, with its columns as (memory mapped) arrays """
+
+    def __init__(self, path, mmap=True):
+        """ Open a front
+
+            Args:
+                path (str): .npz file written by save
+                mmap (bool): memory map the columns instead of reading them into memory (default: True)
+        """
+
+        with open(path, 'rb') as file, zipfile.ZipFile(file) as archive:
+            columns = {info.filename[:-len('.npy')]: _member(file, info, mmap) for info in archive.infolist()}
+
+        self.names = [str(name) for name in columns['names']]
+        self.objs = columns['objs']
+        self.ids = [str(name) for name in columns['ids']] or None
+        self.widths = columns['widths']
+        self.gap_columns = columns['gap_columns']
+        self.offsets = columns['offsets']
+        self.seqs = columns['seqs']
+
+    def __len__(self):
+        return len(self.widths)
+
+    def alignment(self, idx):
+        """ Alphabet codes of alignment idx (sequences x width), a view of the file when memory mapped """
+
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        width = int(self.widths[idx])
+        return self.seqs[start:end].reshape(-1, width) if width else np.zeros((0, 0), dtype=np.uint8)
+
+    def to_align(self, idx):
+        """ Alignment idx as an Align object, with its record ids and dropped gap columns """
+        from EvoAlign.align import Align
+
+        align = Align()
+        align.seqs = self.alignment(idx)
+        align.ids = self.ids
+        align.gap_columns = int(self.gap_columns[idx])
+        return align
+
+    def to_strings(self, idx):
+        """ Alignment idx decoded to one string per sequence """
+        return [''.join(seq) for seq in decode(self.alignment(idx))]
+
+    def to_df(self):
+        """ Objectives of the front as a DataFrame, one column per objective """
+        import pandas as pd
+
+        return pd.DataFrame(np.asarray(self.objs), columns=self.names)
+
+
+def load(path, mmap=True):
+    """ Open a front written by save, see Front """
+    return Front(path, mmap)
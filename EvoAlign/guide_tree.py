@@ -0,0 +1,212 @@
+"""
+Progressive seed alignments: k-mer distances, a guide tree and profile-profile alignment along it
+"""
+import numpy as np
+from EvoAlign.scoring import ALPHABET, GAP, dense_matrix, column_profile
+from EvoAlign.smith_waterman import DELETION, INSERTION, MATCH
+
+
+def kmer_distances(seqs, k=3):
+    """ Pairwise k-mer distances of unaligned sequences, 1 - fraction of shared k-mers (as in MUSCLE)
+
+        Every sequence is counted as a vector over the distinct k-mers of all sequences, and
+        the shared counts sum(min(a, b)) of all pairs are a sum over count thresholds t of
+        (counts >= t) @ (counts >= t).T, so the matrix is a few matrix products.
+
+        Args:
+            seqs (list[ndarray]): alphabet codes of the sequences (gaps are ignored)
+            k (int): k-mer length (default: 3)
+
+        Return:
+            dist (ndarray): float64 symmetric distance matrix (sequences x sequences), 0 on the diagonal
+    """
+
+    # k-mer ids of every sequence: its windows of k codes read as base len(ALPHABET) numbers
+    ids, owners = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for idx, seq in enumerate(seqs):
+        seq = np.asarray(seq)[np.asarray(seq) != GAP].astype(np.int64)
+        if len(seq) >= k:
+            windows = np.lib.stride_tricks.sliding_window_view(seq, k)
+            ids.append(windows @ len(ALPHABET) ** np.arange(k - 1, -1, -1))
+            owners.append(np.full(len(windows), idx))
+
+    # count matrix over the k-mers that occur at all
+    kmers, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+    counts = np.zeros((len(seqs), len(kmers)), dtype=np.int64)
+    np.add.at(counts, (np.concatenate(owners), inverse), 1)
+
+    # shared k-mers of every pair, one product per count threshold
+    shared = np.zeros((len(seqs), len(seqs)))
+    for threshold in range(1, counts.max(initial=0) + 1):
+        present = (counts >= threshold).astype(np.float32)
+        shared += present @ present.T
+
+    # fraction of the shorter sequence's k-mers shared, no shared k-mers is the largest distance
+    windows = counts.sum(axis=1)
+    dist = 1 - shared / np.maximum(np.minimum.outer(windows, windows), 1)
+    np.fill_diagonal(dist, 0)
+    return dist
+
+
+def upgma(dist):
+    """ UPGMA guide tree: repeatedly join the closest clusters, averaging their distances
+
+        Args:
+            dist (ndarray): symmetric distance matrix (sequences x sequences)
+
+        Return:
+            merges (list[tuple]): (node, node) joined at every step; nodes 0..n-1 are the sequences
+                and node n + i is the cluster made by step i
+    """
+
+    n = len(dist)
+    dist = np.array(dist, dtype=np.float64)
+    np.fill_diagonal(dist, np.inf)
+
+    # node and size of the cluster in every row, rows of joined clusters are retired with inf
+    nodes, sizes = list(range(n)), np.ones(n)
+    merges = []
+    for step in range(n - 1):
+        a, b = np.unravel_index(np.argmin(dist), dist.shape)
+        a, b = min(a, b), max(a, b)
+        merges.append((nodes[a], nodes[b]))
+
+        # the joined cluster takes row a, its distances are size weighted averages
+        joined = (dist[a] * sizes[a] + dist[b] * sizes[b]) / (sizes[a] + sizes[b])
+        dist[a], dist[:, a] = joined, joined
+        dist[a, a] = np.inf
+        dist[b], dist[:, b] = np.inf, np.inf
+        nodes[a], sizes[a] = n + step, sizes[a] + sizes[b]
+    return merges
+
+
+def neighbor_joining(dist):
+    """ Neighbor-joining guide tree (Saitou and Nei), joining the pair minimizing the Q criterion
+
+        Args:
+            dist (ndarray): symmetric distance matrix (sequences x sequences)
+
+        Return:
+            merges (list[tuple]): (node, node) joined at every step, numbered like upgma
+    """
+
+    n = len(dist)
+    dist = np.array(dist, dtype=np.float64)
+
+    # rows still in the tree and the node each of them stands for
+    active, nodes = np.ones(n, dtype=bool), list(range(n))
+    merges = []
+    for step in range(n - 1):
+        idx = np.flatnonzero(active)
+        sub = dist[np.ix_(idx, idx)]
+        if len(idx) > 2:
+            # Q(a, b) = (r - 2) d(a, b) - sum of d(a, .) - sum of d(b, .)
+            totals = sub.sum(axis=1)
+            q = (len(idx) - 2) * sub - totals[:, None] - totals[None, :]
+            np.fill_diagonal(q, np.inf)
+            a, b = np.unravel_index(np.argmin(q), q.shape)
+        else:
+            a, b = 0, 1
+        a, b = idx[min(a, b)], idx[max(a, b)]
+        merges.append((nodes[a], nodes[b]))
+
+        # distances of the new node, which takes row a
+        joined = (dist[a] + dist[b] - dist[a, b]) / 2
+        dist[a], dist[:, a] = joined, joined
+        dist[a, a] = 0
+        active[b] = False
+        nodes[a] = n + step
+    return merges
+
+
+def align_profiles(group1, group2, dense):
+    """ Globally align two alignments column against column, maximizing the sum of pairs score
+    of the merged alignment (Needleman-Wunsch on their column profiles)
+
+        Pairing column x of group1 with column y of group2 adds profile1[x] @ S @ profile2[y]
+        to the sum of pairs score, and opposite an all-gap column it adds
+        profile1[x] @ S[:, GAP] * len(group2), so the gap costs come from the matrix itself.
+        Rows are filled like EvoAlign.smith_waterman.next_row, with the position dependent gap
+        costs folded into the running maximum through their prefix sums.
+
+        Args:
+            group1 (ndarray): 2D array of alphabet codes (rows x columns)
+            group2 (ndarray): 2D array of alphabet codes (rows x columns)
+            dense (ndarray): dense substitution matrix from dense_matrix (unscorable pairs count 0)
+
+        Return:
+            merged (ndarray): 2D array of alphabet codes, the rows of group1 then the rows of group2
+    """
+
+    sub = np.nan_to_num(dense)
+    profile1, profile2 = column_profile(group1), column_profile(group2)
+    m, n = len(profile1), len(profile2)
+
+    # score of every column pair, and of every column opposite a gap column of the other group
+    pairs = profile1 @ sub @ profile2.T
+    gaps1 = profile1 @ sub[:, GAP] * len(group2)
+    gaps2 = profile2 @ sub[:, GAP] * len(group1)
+    ramp = np.concatenate(([0.0], np.cumsum(gaps2)))
+
+    # fill the traceback matrix one row at a time, the first row and column are all gaps
+    q = np.zeros((m + 1, n + 1), dtype=np.uint8)
+    q[0, 1:], q[1:, 0] = INSERTION, DELETION
+    row = ramp.copy()
+    for i in range(1, m + 1):
+        match = row[:-1] + pairs[i - 1]
+        deletion = row + gaps1[i - 1]
+        best = np.empty(n + 1)
+        best[0] = deletion[0]
+        best[1:] = np.maximum(match, deletion[1:])
+        row = np.maximum.accumulate(best - ramp) + ramp
+
+        # ties prefer MATCH, then INSERTION, then DELETION like the Smith-Waterman kernel
+        insertion = row[:-1] + gaps2
+        q[i, 1:] = np.where(match == row[1:], MATCH, np.where(insertion == row[1:], INSERTION, DELETION))
+
+    # walk back from the bottom right corner, recording the source column of each side (-1 for a gap)
+    cols1, cols2 = [], []
+    i, j = m, n
+    while i > 0 or j > 0:
+        direction = q[i, j]
+        cols1.append(i - 1 if direction != INSERTION else -1)
+        cols2.append(j - 1 if direction != DELETION else -1)
+        i -= direction != INSERTION
+        j -= direction != DELETION
+    cols1, cols2 = np.array(cols1[::-1], dtype=np.int64), np.array(cols2[::-1], dtype=np.int64)
+
+    # copy the columns of both groups into the merged alignment at once
+    merged = np.full((len(group1) + len(group2), len(cols1)), GAP, dtype=np.uint8)
+    merged[:len(group1), cols1 >= 0] = group1[:, cols1[cols1 >= 0]]
+    merged[len(group1):, cols2 >= 0] = group2[:, cols2[cols2 >= 0]]
+    return merged
+
+
+def progressive(seqs, merges, matrix):
+    """ Progressive alignment of sequences, joining their alignments in the order of a guide tree
+
+        Args:
+            seqs (list[ndarray]): alphabet codes of the sequences (gaps are ignored)
+            merges (list[tuple]): guide tree from upgma or neighbor_joining
+            matrix (dict): substitution dict such as bl.BLOSUM(62) or AminoAcid().hydropthy_dict
+
+        Return:
+            aligned (ndarray): 2D array of alphabet codes, one row per sequence in the given order
+    """
+
+    dense = dense_matrix(matrix)
+
+    # node -> (sequence indices, their alignment), starting from every sequence on its own
+    nodes = {idx: ([idx], np.asarray(seq)[np.asarray(seq) != GAP][None, :])
+             for idx, seq in enumerate(seqs)}
+    for step, (a, b) in enumerate(merges):
+        (order1, group1), (order2, group2) = nodes.pop(a), nodes.pop(b)
+        nodes[len(seqs) + step] = (order1 + order2, align_profiles(group1, group2, dense))
+
+    # put the rows of the root alignment back in sequence order
+    (order, aligned), = nodes.values()
+    return aligned[np.argsort(order)]
+
+
+# guide tree builders by name
+TREES = {'upgma': upgma, 'nj': neighbor_joining}
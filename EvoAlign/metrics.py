@@ -0,0 +1,153 @@
+"""
+Run metrics of Evo: per-agent, per-objective and per-stage counters reported through hooks
+"""
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """ Counters of an Evo, read as snapshots passed to the registered hooks
+
+        agents       name -> calls, seconds, accepted (offspring that entered the Pareto front)
+        fitness      name -> calls, seconds spent evaluating
+        stages       name -> calls, seconds ('prune', 'checkpoint', 'convergence', 'screen'),
+                     'screen' also counts the offspring dropped without exact scoring
+    """
+
+    def __init__(self):
+        self.agents = {}
+        self.fitness = {}
+        self.stages = {}
+
+        # callables receiving every snapshot emitted
+        self.hooks = []
+
+    @staticmethod
+    def _count(counters, name, seconds, **extra):
+        """ Add one call taking seconds (and any extra counts) to the counters of name """
+        entry = counters.setdefault(name, {'calls': 0, 'seconds': 0.0, **{key: 0 for key in extra}})
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        for key, value in extra.items():
+            entry[key] += value
+
+    def agent(self, name, seconds, accepted):
+        """ Record one agent call and whether its offspring entered the population """
+        Metrics._count(self.agents, name, seconds, accepted=int(accepted))
+
+    def evaluation(self, name, seconds):
+        """ Record one evaluation of a fitness function """
+        Metrics._count(self.fitness, name, seconds)
+
+    def merge(self, other):
+        """ Add the counters of another Metrics (e.g. of an island) to these """
+        for mine, theirs in ((self.agents, other.agents), (self.fitness, other.fitness), (self.stages, other.stages)):
+            for name, entry in theirs.items():
+                counters = mine.setdefault(name, {key: 0 for key in entry})
+                for key, value in entry.items():
+                    counters[key] = counters.get(key, 0) + value
+
+    def screening(self, seconds, dropped):
+        """ Record one offspring screened by its estimated scores and whether it was dropped """
+        Metrics._count(self.stages, 'screen', seconds, dropped=int(dropped))
+
+    @contextmanager
+    def timer(self, name):
+        """ Time the enclosed block as one call of the stage name """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics._count(self.stages, name, time.perf_counter() - start)
+
+    def snapshot(self, **state):
+        """ Copy of the counters with the survival fraction of every agent, plus the given state
+
+            Return:
+                snapshot (dict): state fields, then 'agents', 'fitness' and 'stages'
+        """
+
+        agents = {name: dict(entry, survival=entry['accepted'] / entry['calls'])
+                  for name, entry in self.agents.items()}
+        return dict(state, agents=agents,
+                    fitness={name: dict(entry) for name, entry in self.fitness.items()},
+                    stages={name: dict(entry) for name, entry in self.stages.items()})
+
+    def emit(self, **state):
+        """ Pass a snapshot to every hook
+
+            Return:
+                snapshot (dict): the snapshot passed
+        """
+
+        snapshot = self.snapshot(**state)
+        for hook in self.hooks:
+            hook(snapshot)
+        return snapshot
+
+    @staticmethod
+    def summary(snapshot):
+        """ One line status of a snapshot emitted by Evo.evolve """
+
+        best = ' '.join(f'{name}={score:g}' for name, score in snapshot['best'].items())
+        survival = ' '.join(f"{name}={entry['survival']:.0%}" for name, entry in snapshot['agents'].items())
+        stats = ''.join(f' | {name} {value:g}' for name, value in snapshot.get('stats', {}).items())
+        improvement = snapshot.get('convergence', {}).get('improvement')
+        stats += f' | front gain {improvement:.2%}' if improvement is not None else ''
+        stats += f" | evicted {snapshot['evicted']}" if snapshot.get('evicted') else ''
+        screen = snapshot['stages'].get('screen')
+        stats += f" | screened out {screen['dropped']}/{screen['calls']}" if screen else ''
+        return (f"gen {snapshot['generation']} | {snapshot['gens_per_second']:.1f} gen/s | "
+                f"pop {snapshot['population']} | max {best} | survival {survival} | "
+                f"cache hits {snapshot['cache']['hit_rate']:.0%}{stats}")
+
+
+def flatten(snapshot, prefix=''):
+    """ Flatten the nested dicts of a snapshot into 'agents.name.calls' style columns """
+
+    columns = {}
+    for key, value in snapshot.items():
+        if isinstance(value, dict):
+            columns.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            columns[prefix + key] = value
+    return columns
+
+
+class JsonlSink:
+    """ Hook appending every snapshot to a JSON lines file """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, snapshot):
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(snapshot) + '\n')
+
+
+class CsvSink:
+    """ Hook appending every snapshot to a CSV file, one flattened row per snapshot
+
+        The columns are fixed by the first snapshot written; later agents or objectives
+        are left out rather than shifting the columns.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+
+    def __call__(self, snapshot):
+        row = flatten(snapshot)
+        with open(self.path, 'a', newline='') as file:
+            writer = csv.DictWriter(file, self.columns or list(row), extrasaction='ignore')
+            if self.columns is None:
+                self.columns = writer.fieldnames
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def sink(path):
+    """ Hook writing snapshots to path, as CSV for a .csv file and JSON lines otherwise """
+    return CsvSink(path) if str(path).endswith('.csv') else JsonlSink(path)
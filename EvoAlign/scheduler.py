@@ -0,0 +1,87 @@
+"""
+Agent schedulers of Evo: which registered agent runs next
+"""
+import random as rnd
+
+
+class UniformScheduler:
+    """ Pick every agent with the same probability (the original behaviour of Evo) """
+
+    def choose(self, names):
+        """ Name of the agent to run next out of the registered names """
+        return rnd.choice(names)
+
+    def record(self, name, seconds, accepted):
+        """ Learn from one run of an agent (nothing to learn) """
+
+    def stats(self):
+        """ Allocation statistics (none kept) """
+        return {}
+
+
+class BanditScheduler:
+    """ Multi-armed bandit allocating runs to the agents producing the most non-dominated
+        offspring per second of agent time
+
+        Every agent's productivity is a rate of accepted offspring per second, with a
+        Gamma(1 + accepted, seconds) posterior. Each pick draws a rate from every agent's
+        posterior and runs the agent with the highest draw (Thompson sampling), so agents
+        are run in proportion to the chance that they are the most productive. Older runs
+        are discounted by decay at every record, as productivity changes over a run.
+        Runs depend on measured times, so a seeded run only repeats exactly with the
+        UniformScheduler.
+    """
+
+    def __init__(self, decay=0.99, warmup=2):
+        # weight kept by past runs at every new record, and runs of every agent before sampling
+        self.decay = decay
+        self.warmup = warmup
+
+        # name -> [runs, discounted accepted offspring, discounted seconds]
+        self.arms = {}
+
+    def choose(self, names):
+        """ Name of the agent to run next out of the registered names """
+
+        for name in names:
+            self.arms.setdefault(name, [0, 0.0, 0.0])
+
+        # every agent is run a few times before its rate is trusted
+        untried = [name for name in names if self.arms[name][0] < self.warmup]
+        if untried:
+            return rnd.choice(untried)
+
+        # draw a rate from every agent's posterior and run the best draw
+        draws = [rnd.gammavariate(1 + accepted, 1 / max(seconds, 1e-9))
+                 for _, accepted, seconds in (self.arms[name] for name in names)]
+        return names[draws.index(max(draws))]
+
+    def record(self, name, seconds, accepted):
+        """ Learn from one run of an agent
+
+            Args:
+                name (str): agent run
+                seconds (float): time the agent took
+                accepted (bool): whether its offspring entered the population
+        """
+
+        # discount the past of every agent, then count the new run
+        for arm in self.arms.values():
+            arm[1] *= self.decay
+            arm[2] *= self.decay
+        arm = self.arms.setdefault(name, [0, 0.0, 0.0])
+        arm[0] += 1
+        arm[1] += accepted
+        arm[2] += seconds
+
+    def stats(self):
+        """ Allocation of the runs so far
+
+            Return:
+                stats (dict): name -> runs, share of all runs and estimated accepted offspring per second
+        """
+
+        total = sum(runs for runs, _, _ in self.arms.values())
+        return {name: {'runs': runs, 'share': runs / total if total else 0.0,
+                       'rate': (1 + accepted) / seconds if seconds else 0.0}
+                for name, (runs, accepted, seconds) in self.arms.items()}
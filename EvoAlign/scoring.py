@@ -0,0 +1,331 @@
+"""
+Dense substitution matrices and column-profile sum-of-pairs scoring
+"""
+import numpy as np
+
+
+# residue alphabet covered by the BLOSUM and amino acid property matrices ('*' is the gap/padding character)
+ALPHABET = '*ARNDCQEGHILKMFPSTWYVBZXJ'
+
+# reserved code of the gap and trailing '*' characters
+GAP = ALPHABET.index('*')
+
+# lookup table from unicode code point to alphabet index (-1 for characters outside the alphabet)
+_LOOKUP = np.full(128, -1, dtype=np.int16)
+_LOOKUP[[ord(char) for char in ALPHABET]] = np.arange(len(ALPHABET))
+
+# characters of the alphabet indexed by code
+_CHARS = np.array(list(ALPHABET))
+
+# fixed point scale at which two decimal scoring matrices are summed exactly
+_SCALE = 100
+
+# dense matrices already built from scoring dicts: id(matrix) -> (matrix, ndarray)
+_DENSE = {}
+
+# fixed point forms of the dense matrices: id(dense) -> (dense, ndarray, scale)
+_FIXED = {}
+
+# columns of a profile gathered at once by row_pairs
+_ROW_CHUNK = 1024
+
+
+def encode(seqs):
+    """ Convert characters to uint8 alphabet codes
+
+        Args:
+            seqs (ndarray, str, bytes): '<U1' array, string or ASCII bytes of amino acid characters
+
+        Return:
+            codes (ndarray): uint8 array of alphabet codes with the same shape as seqs
+    """
+
+    # strings are encoded as a 1D array of their characters
+    if isinstance(seqs, str):
+        seqs = np.array(list(seqs), dtype='<U1')
+
+    # look up the code point of every character (characters past ASCII are outside the alphabet)
+    if isinstance(seqs, (bytes, bytearray)):
+        # bytes read from a file are looked up without decoding them to characters
+        points = np.frombuffer(seqs, dtype=np.uint8)
+    else:
+        points = np.ascontiguousarray(seqs, dtype='<U1').view(np.uint32)
+    codes = _LOOKUP[np.minimum(points, len(_LOOKUP) - 1)]
+    codes[points >= len(_LOOKUP)] = -1
+
+    # unknown residues can not be scored by any matrix
+    if (codes < 0).any():
+        raise KeyError(f'residues outside the scoring alphabet: {set(map(chr, points[codes < 0].tolist()))}')
+
+    return codes.astype(np.uint8)
+
+
+def decode(codes):
+    """ Convert uint8 alphabet codes back to characters
+
+        Args:
+            codes (ndarray): array of alphabet codes
+
+        Return:
+            seqs (ndarray): '<U1' array of amino acid characters with the same shape as codes
+    """
+
+    return _CHARS[codes]
+
+
+def dense_matrix(matrix):
+    """ Build (once) the dense form of a substitution dict such as bl.BLOSUM(62) or AminoAcid().hydropthy_dict
+
+        Args:
+            matrix (dict): scoring dict keyed by two character strings ('AR', 'W*', ...)
+
+        Return:
+            dense (ndarray): float64 matrix indexed by alphabet index, NaN where the pair can not be scored
+    """
+
+    # reuse the matrix built for this dict on an earlier call
+    cached = _DENSE.get(id(matrix))
+    if cached is not None and cached[0] is matrix:
+        return cached[1]
+
+    # defaultdicts (BLOSUM) score missing pairs with their default, plain dicts can not score them
+    factory = getattr(matrix, 'default_factory', None)
+    missing = factory() if factory is not None else np.nan
+    missing = missing if np.isfinite(missing) else np.nan
+
+    # fill every pair of the alphabet without inserting into the (default)dict
+    dense = np.array([[matrix[a + b] if a + b in matrix else missing for b in ALPHABET]
+                      for a in ALPHABET], dtype=np.float64)
+
+    # keep the dict alive alongside its dense form so its id can not be reused
+    _DENSE[id(matrix)] = (matrix, dense)
+    return dense
+
+
+def column_profile(codes):
+    """ Count the residues in every column of an encoded alignment
+
+        Args:
+            codes (ndarray): 2D array of alphabet indices (sequences x columns)
+
+        Return:
+            profile (ndarray): int64 array of residue counts (columns x alphabet)
+    """
+
+    # offset the code of every cell by its column so one bincount counts all columns at once
+    width = codes.shape[1]
+    offsets = np.arange(width) * len(ALPHABET)
+    counts = np.bincount((codes + offsets).ravel(), minlength=width * len(ALPHABET))
+    return counts.reshape(width, len(ALPHABET))
+
+
+class BlockProfile:
+    """ Column profile (columns x alphabet counts) kept in read-only blocks of BLOCK columns
+
+        Copies of an alignment share the blocks. An edit builds new blocks only for the
+        columns it changed and shares all the others, so it copies O(changed columns + BLOCK)
+        counts instead of the whole profile.
+    """
+
+    # columns per block
+    BLOCK = 128
+
+    def __init__(self, blocks, width):
+        self.blocks = blocks
+        self.width = width
+
+    @staticmethod
+    def of(profile):
+        """ Blocks of a whole profile (views of it, it must not be written to afterwards) """
+        profile.flags.writeable = False
+        return BlockProfile([profile[lo:lo + BlockProfile.BLOCK] for lo in range(0, len(profile), BlockProfile.BLOCK)],
+                            len(profile))
+
+    def __len__(self):
+        return self.width
+
+    def array(self):
+        """ The whole profile as one array """
+        if not self.blocks:
+            return np.zeros((0, len(ALPHABET)), dtype=np.int64)
+        return np.concatenate(self.blocks)
+
+    def columns(self, lo, hi, n):
+        """ Copy of the counts of columns lo to hi, columns past the profile are gaps in all n rows """
+
+        out = np.zeros((hi - lo, len(ALPHABET)), dtype=np.int64)
+        out[max(self.width - lo, 0):, GAP] = n
+        block = BlockProfile.BLOCK
+        for idx in range(lo // block, min(-(-hi // block), len(self.blocks))):
+            start, stop = max(lo, idx * block), min(hi, idx * block + len(self.blocks[idx]))
+            out[start - lo:stop - lo] = self.blocks[idx][start - idx * block:stop - idx * block]
+        return out
+
+    def gaps(self, lo, hi):
+        """ Gap counts of columns lo to hi (within the profile) """
+        block = BlockProfile.BLOCK
+        if lo >= hi:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.blocks[idx][max(lo - idx * block, 0):hi - idx * block, GAP]
+                               for idx in range(lo // block, -(-hi // block))])
+
+    def replace(self, lo, values, width, n):
+        """ Profile of width columns with the counts of columns lo on replaced by values, and new
+        columns past the old width all gaps in n rows; the untouched blocks are shared
+
+            Whole blocks of values are kept as views (values must not be written to afterwards),
+            so a block aligned lo copies nothing but the partial blocks at the ends.
+
+            Args:
+                lo (int): first column replaced
+                values (ndarray): counts of the columns replaced (columns x alphabet)
+                width (int): width of the new profile (at least the old one)
+                n (int): number of rows
+
+            Return:
+                profile (BlockProfile): the new profile
+        """
+
+        block, hi = BlockProfile.BLOCK, lo + len(values)
+        blocks = self.blocks + [None] * (-(-width // block) - len(self.blocks))
+        values.flags.writeable = False
+
+        # blocks overlapping the replaced columns, and the last old block and new ones when the profile grows
+        changed = set(range(lo // block, -(-hi // block)))
+        if width > self.width:
+            changed.update(range(self.width // block, len(blocks)))
+        for idx in sorted(changed):
+            start, stop = idx * block, min((idx + 1) * block, width)
+            if lo <= start and stop <= hi:
+                blocks[idx] = values[start - lo:stop - lo]
+                continue
+            counts = self.columns(start, stop, n)
+            first, last = max(lo, start), min(hi, stop)
+            if first < last:
+                counts[first - start:last - start] = values[first - lo:last - lo]
+            counts.flags.writeable = False
+            blocks[idx] = counts
+        return BlockProfile(blocks, width)
+
+    def delete(self, columns, n):
+        """ Profile without the given (sorted) columns; the blocks before the first one are shared """
+
+        if len(columns) == 0:
+            return self
+        lo = columns[0] // BlockProfile.BLOCK * BlockProfile.BLOCK
+        tail = np.delete(self.columns(lo, self.width, n), columns - lo, axis=0)
+        return BlockProfile(self.blocks[:lo // BlockProfile.BLOCK], lo).replace(lo, tail, lo + len(tail), n)
+
+
+def fixed_point(dense):
+    """ Integer form of a dense matrix with at most two decimals (BLOSUM, AminoAcid dicts)
+
+        Pairs missing from the scoring dict (NaN) are zeroed, callers reject them with check_pairs.
+
+        Args:
+            dense (ndarray): dense substitution matrix from dense_matrix
+
+        Return:
+            sub (ndarray): int64 matrix scaled by scale, or the float64 matrix itself
+            scale (int): factor the matrix was scaled by (1 when it is not fixed point)
+    """
+
+    # reuse the form computed for this matrix on an earlier call
+    cached = _FIXED.get(id(dense))
+    if cached is not None and cached[0] is dense:
+        return cached[1], cached[2]
+
+    # scale by 100 and keep the integer form when nothing is lost
+    sub = np.nan_to_num(dense)
+    scaled = np.rint(sub * _SCALE)
+    if np.allclose(sub * _SCALE, scaled, rtol=0, atol=1e-6):
+        sub, scale = scaled.astype(np.int64), _SCALE
+    else:
+        scale = 1
+
+    _FIXED[id(dense)] = (dense, sub, scale)
+    return sub, scale
+
+
+def check_pairs(counts, dense):
+    """ Raise a KeyError if residues of an alignment pair up outside the scoring dict
+
+        Args:
+            counts (ndarray): residue totals (alphabet), or profile / stacked totals ending in the alphabet axis
+            dense (ndarray): dense substitution matrix from dense_matrix
+    """
+
+    # only the residues that actually occur in the alignment matter
+    used = np.flatnonzero(counts.reshape(-1, len(ALPHABET)).any(axis=0))
+    sub = dense[np.ix_(used, used)]
+    if np.isnan(sub).any():
+        missing = {ALPHABET[used[a]] + ALPHABET[used[b]] for a, b in zip(*np.nonzero(np.isnan(sub)))}
+        raise KeyError(f'pairs missing from the scoring matrix: {missing}')
+
+
+def pair_counts(profile):
+    """ Count the residue pairs of an alignment, the only part of it sum of pairs scores depend on
+
+        pairs[a, b] sums counts[a] * counts[b] over the columns, so the ordered pairs of every
+        substitution matrix are (pairs * M).sum(): one alphabet x alphabet product per matrix,
+        whatever the size of the alignment.
+
+        Args:
+            profile (ndarray): residue counts (columns x alphabet) from column_profile
+
+        Return:
+            pairs (ndarray): int64 pair counts (alphabet x alphabet)
+            counts (ndarray): int64 residue totals (alphabet)
+    """
+
+    return profile.T @ profile, profile.sum(axis=0)
+
+
+def row_pairs(profile, row):
+    """ Pairs of one row with the rows counted in a profile: pairs[a, b] counts row residue a
+        sitting in a column with residue b
+
+        Adding the row to the profile adds pairs + pairs.T + diag(bincount(row)) to pair_counts,
+        removing it (from a profile that includes it) subtracts pairs + pairs.T - diag(bincount(row)).
+
+        Args:
+            profile (ndarray): residue counts (columns x alphabet)
+            row (ndarray): alphabet codes of the row, one per profile column
+
+        Return:
+            pairs (ndarray): int64 pair counts (alphabet x alphabet)
+    """
+
+    # group the profile columns by the row's residue and sum every group at once, a chunk of
+    # columns at a time so the gathered copy of the profile stays small
+    pairs = np.zeros((len(ALPHABET), len(ALPHABET)), dtype=np.int64)
+    for lo in range(0, len(row), _ROW_CHUNK):
+        chunk = row[lo:lo + _ROW_CHUNK]
+        order = np.argsort(chunk, kind='stable')
+        residues = chunk[order]
+        starts = np.flatnonzero(np.concatenate(([True], residues[1:] != residues[:-1])))
+        pairs[residues[starts]] += np.add.reduceat(profile[lo + order], starts, axis=0)
+    return pairs
+
+
+def pairs_total(pairs, counts, dense):
+    """ Sum of pairs total of alignments from their pair counts
+
+        All ordered pairs minus every residue paired with itself leaves every unordered pair
+        of rows counted twice. The total is kept in these doubled fixed point units (see
+        fixed_point) so it is exact; divide by 2 * scale for the score. Asymmetric matrices
+        are therefore scored by their symmetric part.
+
+        Args:
+            pairs (ndarray): pair counts from pair_counts, or a stack of them (alignments x alphabet x alphabet)
+            counts (ndarray): residue totals from pair_counts, or a stack of them (alignments x alphabet)
+            dense (ndarray): dense substitution matrix from dense_matrix
+
+        Return:
+            total (int, float, ndarray): twice the sum of pairs score in fixed point units (one per alignment)
+    """
+
+    # a residue pair missing from the scoring dict can not be scored
+    check_pairs(counts, dense)
+    sub, _ = fixed_point(dense)
+    return (pairs * sub).sum(axis=(-2, -1)) - counts @ np.diag(sub)
@@ -0,0 +1,367 @@
+"""
+Vectorized Smith-Waterman kernels used by the Align mutation agents
+"""
+from math import ceil
+import numpy as np
+from EvoAlign.scoring import GAP, dense_matrix
+
+
+DELETION, INSERTION, MATCH = range(3)
+
+# smallest band half width tried by band='auto', and its starting fraction of the segment length
+MIN_BAND = 8
+AUTO_BAND = 0.1
+
+# largest traceback matrix (in cells, one byte each) kept whole before switching to align_checkpointed
+MAX_CELLS = 2 ** 26
+
+
+def substitution_row(residue, seq2, match_score, mismatch_penalty, matrix=None):
+    """ Score one residue of seq1 against every residue of seq2 (or broadcast arrays of residues against seq2)
+
+        Args:
+            residue (int, ndarray): alphabet code of the seq1 residue
+            seq2 (ndarray): alphabet codes of seq2
+            match_score (int): score for a match (used without a matrix)
+            mismatch_penalty (int): penalty for a mismatch (used without a matrix)
+            matrix (dict): substitution dict such as bl.BLOSUM(62) (default: flat match/mismatch scores)
+
+        Return:
+            scores (ndarray): float64 score of the residue against every residue of seq2
+    """
+
+    # flat scoring scheme
+    if matrix is None:
+        return np.where(seq2 == residue, float(match_score), float(mismatch_penalty))
+
+    # look the pairs up in the dense form of the substitution matrix
+    scores = dense_matrix(matrix)[residue, seq2]
+    if np.isnan(scores).any():
+        raise KeyError('pairs missing from the substitution matrix')
+    return scores
+
+
+def next_row(prev, residue, seq2, insertion_penalty=-1, deletion_penalty=-1, mismatch_penalty=-1, match_score=2,
+             matrix=None):
+    """ Fill one row of the similarity matrix from the row above it
+
+        Within a row every cell only depends on the row above except through insertions,
+        p[i][j] = max(a[j], p[i][j - 1] + insertion_penalty), which unrolls to a running
+        maximum of a[k] - k * insertion_penalty. Ties are broken as max((0, 0), deletion,
+        insertion, match) over (score, direction) tuples, preferring MATCH, then INSERTION,
+        then DELETION (which also marks cells reset to 0). With integer scores the rows
+        are identical to the cell by cell recurrence.
+
+        Args:
+            prev (ndarray): scores of the row above (n + 1)
+            residue (int): alphabet code of the seq1 residue of this row
+            seq2 (ndarray): alphabet codes of the second segment
+            insertion_penalty, deletion_penalty, mismatch_penalty, match_score, matrix: scoring scheme (see fill)
+
+        Return:
+            row (ndarray): float64 scores of the row (n + 1)
+            directions (ndarray): uint8 traceback directions of the row (n + 1)
+    """
+
+    # candidates coming from the row above
+    match = prev[:-1] + substitution_row(residue, seq2, match_score, mismatch_penalty, matrix)
+    deletion = prev[1:] + deletion_penalty
+
+    # best of the zero floor, deletion and match, then resolve insertions with a prefix max
+    ramp = np.arange(len(prev)) * float(insertion_penalty)
+    row = np.zeros(len(prev))
+    row[1:] = np.maximum(np.maximum(match, deletion), 0)
+    row = np.maximum.accumulate(row - ramp) + ramp
+
+    # direction of the winning candidate with the tuple tie-breaking rule
+    insertion = row[:-1] + insertion_penalty
+    directions = np.zeros(len(prev), dtype=np.uint8)
+    directions[1:] = np.where(match == row[1:], MATCH, np.where(insertion == row[1:], INSERTION, DELETION))
+    return row, directions
+
+
+def fill(seq1, seq2, insertion_penalty=-1, deletion_penalty=-1, mismatch_penalty=-1, match_score=2, matrix=None):
+    """ Fill the similarity matrix p and the traceback matrix q one row at a time (see next_row)
+
+        Args:
+            seq1 (ndarray): alphabet codes of the first segment
+            seq2 (ndarray): alphabet codes of the second segment
+            insertion_penalty (int): penalty for an insertion (default: -1)
+            deletion_penalty (int): penalty for a deletion (default: -1)
+            mismatch_penalty (int): penalty for a mismatch (default: -1)
+            match_score (int): score for a match (default: 2)
+            matrix (dict): substitution dict replacing the match/mismatch scores (default: None)
+
+        Return:
+            p (ndarray): (m + 1) x (n + 1) float64 similarity matrix
+            q (ndarray): (m + 1) x (n + 1) uint8 traceback matrix of DELETION, INSERTION, MATCH
+    """
+
+    scheme = (insertion_penalty, deletion_penalty, mismatch_penalty, match_score, matrix)
+    p = np.zeros((len(seq1) + 1, len(seq2) + 1))
+    q = np.zeros((len(seq1) + 1, len(seq2) + 1), dtype=np.uint8)
+    for i in range(1, len(seq1) + 1):
+        p[i], q[i] = next_row(p[i - 1], seq1[i - 1], seq2, *scheme)
+    return p, q
+
+
+def fill_directions(seq1, seq2, insertion_penalty=-1, deletion_penalty=-1, mismatch_penalty=-1, match_score=2,
+                    matrix=None):
+    """ Fill only the traceback matrix q of fill, keeping one row of scores (one byte per cell)
+
+        Return:
+            q (ndarray): (m + 1) x (n + 1) uint8 traceback matrix of DELETION, INSERTION, MATCH
+    """
+
+    scheme = (insertion_penalty, deletion_penalty, mismatch_penalty, match_score, matrix)
+    row = np.zeros(len(seq2) + 1)
+    q = np.zeros((len(seq1) + 1, len(seq2) + 1), dtype=np.uint8)
+    for i in range(1, len(seq1) + 1):
+        row, q[i] = next_row(row, seq1[i - 1], seq2, *scheme)
+    return q
+
+
+def traceback(q, seq1, seq2):
+    """ Walk the traceback matrix back from the bottom right corner
+
+        Args:
+            q (ndarray): traceback matrix from fill
+            seq1 (ndarray): alphabet codes of the first segment
+            seq2 (ndarray): alphabet codes of the second segment
+
+        Return:
+            seq1_aligned (ndarray): aligned first segment (uint8 codes, GAP for gaps)
+            seq2_aligned (ndarray): aligned second segment (uint8 codes, GAP for gaps)
+    """
+
+    # collect the aligned residues in reverse order
+    aligned1, aligned2 = [], []
+    i, j = len(seq1), len(seq2)
+    while i > 0 and j > 0:
+        if q[i][j] == MATCH:
+            i -= 1
+            j -= 1
+            aligned1.append(seq1[i])
+            aligned2.append(seq2[j])
+        elif q[i][j] == INSERTION:
+            j -= 1
+            aligned1.append(GAP)
+            aligned2.append(seq2[j])
+        else:
+            i -= 1
+            aligned1.append(seq1[i])
+            aligned2.append(GAP)
+
+    return np.array(aligned1[::-1], dtype=np.uint8), np.array(aligned2[::-1], dtype=np.uint8)
+
+
+def align_checkpointed(seq1, seq2, insertion_penalty=-1, deletion_penalty=-1, mismatch_penalty=-1, match_score=2,
+                       matrix=None, step=None):
+    """ Same alignment as fill and traceback without keeping the whole traceback matrix
+
+        A forward pass keeps only every step-th row of scores. The traceback then walks back
+        one block of rows at a time, refilling the directions of the block from the row of
+        scores kept below it. Every row is filled twice, and memory is O((m / step + step) * n),
+        O(sqrt(m) * n) with the default step, instead of O(m * n).
+
+        Args:
+            seq1 (ndarray): alphabet codes of the first segment
+            seq2 (ndarray): alphabet codes of the second segment
+            insertion_penalty, deletion_penalty, mismatch_penalty, match_score, matrix: scoring scheme (see fill)
+            step (int): rows per block (default: sqrt(m))
+
+        Return:
+            seq1_aligned (ndarray): aligned first segment (uint8 codes, GAP for gaps)
+            seq2_aligned (ndarray): aligned second segment (uint8 codes, GAP for gaps)
+    """
+
+    scheme = (insertion_penalty, deletion_penalty, mismatch_penalty, match_score, matrix)
+    m, n = len(seq1), len(seq2)
+    step = step or max(1, ceil(m ** 0.5))
+
+    # forward pass keeping the scores of rows 0, step, 2 * step, ...
+    row = np.zeros(n + 1)
+    checkpoints = {0: row}
+    for i in range(1, m + 1):
+        row, _ = next_row(row, seq1[i - 1], seq2, *scheme)
+        if i % step == 0:
+            checkpoints[i] = row
+
+    # walk back block by block, like traceback
+    aligned1, aligned2 = [], []
+    i, j = m, n
+    while i > 0 and j > 0:
+        # refill the directions of the rows start + 1 .. i from the checkpoint below them
+        start = (i - 1) // step * step
+        q = np.zeros((i - start + 1, n + 1), dtype=np.uint8)
+        row = checkpoints[start]
+        for r in range(start + 1, i + 1):
+            row, q[r - start] = next_row(row, seq1[r - 1], seq2, *scheme)
+
+        while i > start and j > 0:
+            if q[i - start][j] == MATCH:
+                i -= 1
+                j -= 1
+                aligned1.append(seq1[i])
+                aligned2.append(seq2[j])
+            elif q[i - start][j] == INSERTION:
+                j -= 1
+                aligned1.append(GAP)
+                aligned2.append(seq2[j])
+            else:
+                i -= 1
+                aligned1.append(seq1[i])
+                aligned2.append(GAP)
+
+    return np.array(aligned1[::-1], dtype=np.uint8), np.array(aligned2[::-1], dtype=np.uint8)
+
+
+def fill_banded(seq1, seq2, band, insertion_penalty=-1, deletion_penalty=-1, mismatch_penalty=-1, match_score=2,
+                matrix=None):
+    """ Fill the traceback matrix of the cells within band of the diagonal, |i - j| <= band
+
+        Row i holds the cells j = i - band + k for k in 0 .. 2 * band, so the diagonal
+        predecessor of a cell has the same k in the row above and the cell above it has k + 1.
+        Cells outside the band (or the matrix) can not be reached (-inf). Rows are filled
+        like fill, keeping only the previous row of scores, so time and memory are
+        O(m * band) instead of O(m * n).
+
+        Args:
+            seq1 (ndarray): alphabet codes of the first segment
+            seq2 (ndarray): alphabet codes of the second segment
+            band (int): half width of the band
+            insertion_penalty (int): penalty for an insertion (default: -1)
+            deletion_penalty (int): penalty for a deletion (default: -1)
+            mismatch_penalty (int): penalty for a mismatch (default: -1)
+            match_score (int): score for a match (default: 2)
+            matrix (dict): substitution dict replacing the match/mismatch scores (default: None)
+
+        Return:
+            q (ndarray): (m + 1) x (2 * band + 1) banded traceback matrix of DELETION, INSERTION, MATCH
+    """
+
+    m, n, cells = len(seq1), len(seq2), 2 * band + 1
+    q = np.zeros((m + 1, cells), dtype=np.uint8)
+    ramp = np.arange(cells) * float(insertion_penalty)
+
+    # substitution scores of all band cells in one lookup (cells past the ends of seq2 are clipped and never used)
+    if m and n:
+        columns = np.clip(np.arange(m)[:, None] - band + np.arange(cells), 0, n - 1)
+        subs = substitution_row(seq1[:, None], seq2[columns], match_score, mismatch_penalty, matrix)
+
+    # row 0 is all zeros within the matrix (j = k - band >= 0); every row ends in one unreachable
+    # cell, which is also the left neighbour (index -1) of k = 0
+    prev = np.full(cells + 1, -np.inf)
+    prev[band:min(cells, n + band + 1)] = 0
+
+    for i in range(1, m + 1):
+        # band cells with 1 <= j <= n, and the j = 0 cell when the band reaches it
+        lo, hi = max(0, band - i + 1), min(cells - 1, n - i + band)
+        row = np.full(cells + 1, -np.inf)
+        if band - i >= 0:
+            row[band - i] = 0
+
+        if lo <= hi:
+            # candidates coming from the row above
+            match = prev[lo:hi + 1] + subs[i - 1, lo:hi + 1]
+            deletion = prev[lo + 1:hi + 2] + deletion_penalty
+
+            # best of the zero floor, deletion and match, then resolve insertions with a prefix max
+            row[lo:hi + 1] = np.maximum(np.maximum(match, deletion), 0)
+            row[:cells] = np.maximum.accumulate(row[:cells] - ramp) + ramp
+            row[hi + 1:] = -np.inf
+
+            # direction of the winning candidate with the tuple tie-breaking rule of fill
+            insertion = row[np.arange(lo - 1, hi)] + insertion_penalty
+            q[i, lo:hi + 1] = np.where(match == row[lo:hi + 1], MATCH,
+                                       np.where(insertion == row[lo:hi + 1], INSERTION, DELETION))
+        prev = row
+
+    return q
+
+
+def traceback_banded(q, seq1, seq2, band):
+    """ Walk the banded traceback matrix back from the bottom right corner
+
+        Args:
+            q (ndarray): banded traceback matrix from fill_banded
+            seq1 (ndarray): alphabet codes of the first segment
+            seq2 (ndarray): alphabet codes of the second segment
+            band (int): half width of the band
+
+        Return:
+            seq1_aligned (ndarray): aligned first segment (uint8 codes, GAP for gaps)
+            seq2_aligned (ndarray): aligned second segment (uint8 codes, GAP for gaps)
+            edge (bool): whether the path reached the edge of the band (the aligned segments are then incomplete)
+    """
+
+    aligned1, aligned2 = [], []
+    i, j = len(seq1), len(seq2)
+    edge = False
+    while i > 0 and j > 0:
+        # the walk stops at the edge of the band, the alignment is then redone with a wider one
+        k = j - i + band
+        if k == 0 or k == 2 * band:
+            edge = True
+            break
+        if q[i][k] == MATCH:
+            i -= 1
+            j -= 1
+            aligned1.append(seq1[i])
+            aligned2.append(seq2[j])
+        elif q[i][k] == INSERTION:
+            j -= 1
+            aligned1.append(GAP)
+            aligned2.append(seq2[j])
+        else:
+            i -= 1
+            aligned1.append(seq1[i])
+            aligned2.append(GAP)
+
+    return np.array(aligned1[::-1], dtype=np.uint8), np.array(aligned2[::-1], dtype=np.uint8), edge
+
+
+def align_segments(seq1, seq2, insertion_penalty=-1, deletion_penalty=-1, mismatch_penalty=-1, match_score=2,
+                   matrix=None, band=None, max_cells=None):
+    """ Align two segments, within a diagonal band when one is given
+
+        A banded alignment whose path touches the edge of the band may have been cut short
+        by it. A fixed band then falls back to the full matrix, band='auto' doubles the band
+        (starting at AUTO_BAND of the longer segment) until the path stays inside it or the
+        band covers the whole matrix.
+
+        Args:
+            seq1 (ndarray): alphabet codes of the first segment
+            seq2 (ndarray): alphabet codes of the second segment
+            insertion_penalty (int): penalty for an insertion (default: -1)
+            deletion_penalty (int): penalty for a deletion (default: -1)
+            mismatch_penalty (int): penalty for a mismatch (default: -1)
+            match_score (int): score for a match (default: 2)
+            matrix (dict): substitution dict replacing the match/mismatch scores (default: None)
+            band (int, str): half width of the band, 'auto', or None for the full matrix (default: None)
+            max_cells (int): largest full traceback matrix kept (default: MAX_CELLS)
+
+        Return:
+            seq1_aligned (ndarray): aligned first segment (uint8 codes, GAP for gaps)
+            seq2_aligned (ndarray): aligned second segment (uint8 codes, GAP for gaps)
+    """
+
+    scheme = (insertion_penalty, deletion_penalty, mismatch_penalty, match_score, matrix)
+    longest = max(len(seq1), len(seq2))
+    width = max(MIN_BAND, ceil(AUTO_BAND * longest)) if band == 'auto' else band
+
+    # the band is only worth it while it is narrower than the matrix
+    while width is not None and width < longest:
+        # the band has to reach the bottom right corner
+        width = max(width, abs(len(seq1) - len(seq2)))
+        q = fill_banded(seq1, seq2, width, *scheme)
+        seq1_aligned, seq2_aligned, edge = traceback_banded(q, seq1, seq2, width)
+        if not edge:
+            return seq1_aligned, seq2_aligned
+        width = 2 * width if band == 'auto' else None
+
+    # one byte per cell up to max_cells, about sqrt(m) rows of scores above it
+    if (len(seq1) + 1) * (len(seq2) + 1) > (MAX_CELLS if max_cells is None else max_cells):
+        return align_checkpointed(seq1, seq2, *scheme)
+    q = fill_directions(seq1, seq2, *scheme)
+    return traceback(q, seq1, seq2)
@@ -0,0 +1,257 @@
+"""
+Benchmarks of the scoring, mutation and selection stages on synthetic protein families
+
+    python benchmark.py --out bench.json
+    python benchmark.py --sizes 8 32 --lengths 200 --compare bench.json
+
+Every stage is timed over a grid of family sizes (N sequences), lengths (L residues) and
+divergences, and the results are written as JSON so runs of different versions can be
+compared with --compare.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from statistics import median
+import numpy as np
+from EvoAlign import Align, EvoAlign
+from EvoAlign.evo_align import MATRICES
+
+# residues the synthetic families are drawn from
+RESIDUES = np.frombuffer(b'ARNDCQEGHILKMFPSTWYV', dtype=np.uint8)
+
+
+def family(n, length, divergence, seed=0):
+    """ Generate a synthetic protein family: mutated copies of one random ancestor
+
+        Every residue of a member is substituted with probability divergence, and deleted
+        or followed by an inserted residue with probability divergence / 10 each.
+
+        Args:
+            n (int): number of sequences
+            length (int): length of the ancestor
+            divergence (float): substitution rate of every member against the ancestor
+            seed (int): seed of the generator (default: 0)
+
+        Return:
+            seqs (list[str]): the member sequences
+    """
+
+    rng = np.random.default_rng(seed)
+    ancestor = rng.choice(RESIDUES, length)
+
+    seqs = []
+    for _ in range(n):
+        # substitutions
+        member = np.where(rng.random(length) < divergence, rng.choice(RESIDUES, length), ancestor)
+
+        # deletions, then one random residue inserted after the marked positions
+        member = member[rng.random(length) >= divergence / 10]
+        inserted = rng.random(len(member)) < divergence / 10
+        member = np.insert(member, np.flatnonzero(inserted) + 1, rng.choice(RESIDUES, inserted.sum()))
+        seqs.append(member.tobytes().decode())
+    return seqs
+
+
+def write_fasta(seqs, path):
+    """ Write sequences to a FASTA file with ids seq0, seq1, ... """
+    with open(path, 'w') as file:
+        for idx, seq in enumerate(seqs):
+            file.write(f'>seq{idx}\n{seq}\n')
+
+
+def timeit(fn, repeat):
+    """ Time repeated calls of fn
+
+        Return:
+            timing (dict): median and min seconds per call and number of calls
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'seconds': median(times), 'min': min(times), 'repeat': repeat}
+
+
+def bench_scoring(align, repeat):
+    """ Time sum_pairs_score from scratch and a smith_waterman edit with the rescoring of the child for
+    every objective matrix, then all matrices at once for one alignment and for a population """
+
+    results = []
+    for name in (62, 'HYDRO', 'VOL'):
+        matrix = MATRICES[name]
+
+        # a fresh copy has no cached profile, so the whole alignment is counted and scored
+        def full():
+            fresh = Align()
+            fresh.seqs = align.seqs
+            fresh.sum_pairs_score(matrix)
+        results.append(dict(stage='sum_pairs_score', mode='full', matrix=str(name), **timeit(full, repeat)))
+
+        # children of a scored parent are rescored from their two edited rows; smith_waterman already
+        # updates the counts, so the edit is timed with the rescoring
+        align.sum_pairs_score(matrix)
+        def delta():
+            align.copy().smith_waterman(0.25).sum_pairs_score(matrix)
+        results.append(dict(stage='sum_pairs_score', mode='edit+delta', matrix=str(name), **timeit(delta, repeat)))
+
+    # every matrix from one count of a fresh alignment, and a whole population in one stacked product
+    matrices = list(MATRICES.values())
+    def group():
+        fresh = Align()
+        fresh.seqs = align.seqs
+        fresh.sum_pairs_scores(matrices)
+    results.append(dict(stage='sum_pairs_scores', mode='full', matrix='all', **timeit(group, repeat)))
+    def population():
+        Align.score_population([align.copy().smith_waterman(0.25) for _ in range(repeat)], matrices)
+    results.append(dict(stage='score_population', mode='edit+delta', matrix='all', population=repeat,
+                        **timeit(population, 1)))
+    return results
+
+
+def bench_mutation(align, repeat):
+    """ Time one smith_waterman edit of a copy at every mod_len used by the EvoAlign agents, full and banded """
+
+    results = []
+    for mod_len, band in ((0.5, None), (0.25, None), (0.125, None), (0.5, 'auto'), (1.0, 'auto')):
+        results.append(dict(stage='smith_waterman', mod_len=mod_len, band=band,
+                            **timeit(lambda: align.copy().smith_waterman(mod_len, band=band), repeat)))
+    return results
+
+
+def bench_selection(front_sizes, repeat, seed=0):
+    """ Time remove_dominated on populations of random (mostly dominated) three objective points """
+
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in front_sizes:
+        objs = rng.standard_normal((size, 3))
+
+        # the population is refilled before every call, pruning it leaves the first front
+        evo = EvoAlign().Evo
+        evo.pop.names = ('blosum_62_score', 'hydropathy_score', 'volume_score')
+        def prune():
+            evo.pop.objs, evo.pop.sols = objs, list(range(size))
+            evo.remove_dominated()
+        results.append(dict(stage='remove_dominated', front_size=size, **timeit(prune, repeat)))
+        results[-1]['survivors'] = evo.size()
+    return results
+
+
+def bench_evolution(path, gens, workers):
+    """ Time EvoAlign.align end to end and report generations per second """
+
+    evo_align = EvoAlign()
+    evo_align.read_fasta(path)
+
+    # keep the status lines out of the timing output
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        evo_align.align(gens=gens, status=gens, workers=workers, seed=0, checkpoint=None)
+    seconds = time.perf_counter() - start
+    return [{'stage': 'align', 'gens': gens, 'workers': workers, 'seconds': seconds,
+             'gens_per_second': gens / seconds, 'population': evo_align.Evo.size()}]
+
+
+def run(sizes, lengths, divergences, front_sizes, gens, repeat, workers):
+    """ Run every benchmark over the grid of synthetic families
+
+        Return:
+            report (dict): environment, parameters and one result per stage and family
+    """
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            for length in lengths:
+                for divergence in divergences:
+                    family_params = {'N': n, 'L': length, 'divergence': divergence}
+                    print('benchmarking', family_params, file=sys.stderr)
+
+                    # the same family is read through the FASTA reader like user input
+                    path = os.path.join(tmp, 'family.fasta')
+                    write_fasta(family(n, length, divergence), path)
+                    align = Align()
+                    align.read_fasta(path)
+
+                    stages = bench_scoring(align, repeat) + bench_mutation(align, repeat)
+                    stages += bench_evolution(path, gens, workers)
+                    results += [dict(family_params, **stage) for stage in stages]
+
+    results += bench_selection(front_sizes, repeat)
+    return {'environment': environment(),
+            'params': {'sizes': sizes, 'lengths': lengths, 'divergences': divergences,
+                       'front_sizes': front_sizes, 'gens': gens, 'repeat': repeat, 'workers': workers},
+            'results': results}
+
+
+def environment():
+    """ Versions the timings depend on """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def _key(result):
+    """ Identify a result by everything but its measurements """
+    measured = {'seconds', 'min', 'repeat', 'gens_per_second', 'population', 'survivors'}
+    return tuple(sorted((name, value) for name, value in result.items() if name not in measured))
+
+
+def compare(report, baseline, tolerance):
+    """ Print the results slower than in a baseline report by more than the tolerance factor
+
+        Return:
+            regressions (int): number of slower results
+    """
+
+    before = {_key(result): result['seconds'] for result in baseline['results']}
+    regressions = 0
+    for result in report['results']:
+        old = before.get(_key(result))
+        if old and result['seconds'] > tolerance * old:
+            regressions += 1
+            print(f"slower x{result['seconds'] / old:.2f}:", dict(_key(result)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4, 16, 64], help='numbers of sequences N')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[100, 400], help='ancestor lengths L')
+    parser.add_argument('--divergences', type=float, nargs='+', default=[0.1, 0.3], help='substitution rates')
+    parser.add_argument('--front-sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='population sizes pruned by remove_dominated')
+    parser.add_argument('--gens', type=int, default=200, help='generations of the end to end run')
+    parser.add_argument('--repeat', type=int, default=20, help='calls timed per stage')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes of the end to end run')
+    parser.add_argument('--out', default='benchmark.json', help='JSON file to write the results to')
+    parser.add_argument('--compare', default=None, help='baseline JSON file to report regressions against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown factor counted as a regression')
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.lengths, args.divergences, args.front_sizes,
+                 args.gens, args.repeat, args.workers)
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            return 1 if compare(report, json.load(file), args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
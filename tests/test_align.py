@@ -0,0 +1,107 @@
+"""
+Incremental rescoring of Align edits against scoring the edited alignment from scratch
+"""
+import os
+import pickle
+import random as rnd
+import numpy as np
+import pytest
+from EvoAlign import Align
+from EvoAlign.evo_align import MATRICES
+from EvoAlign.scoring import column_profile
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data', 'dash.fasta')
+OBJECTIVES = [MATRICES[62], MATRICES['HYDRO'], MATRICES['VOL']]
+
+
+def fresh(align):
+    """ Copy of an alignment without any cached counts, scored from its rows """
+    copy = Align()
+    copy.seqs = align.seqs
+    copy.gap_columns = align.gap_columns
+    return copy
+
+
+def many_rows(align, rows, seed):
+    """ Alignment of the given number of rows: copies of the alignment's rows with a tenth of the residues mutated """
+    rng = np.random.default_rng(seed)
+    seqs = np.vstack([align.seqs] * -(-rows // len(align.rows)))[:rows].copy()
+    mutated = (rng.random(seqs.shape) < 0.1) & (seqs != 0)
+    seqs[mutated] = rng.integers(1, 21, mutated.sum())
+    copy = Align()
+    copy.seqs = seqs
+    return copy
+
+
+@pytest.fixture
+def align():
+    align = Align()
+    align.read_fasta(DATA)
+    return align
+
+
+@pytest.mark.parametrize('band', [None, 'auto'])
+def test_delta_matches_full(align, band):
+    rnd.seed(0)
+    align.sum_pairs_scores(OBJECTIVES)
+    for mod_len in (0.5, 0.25, 0.125) * 5:
+        align = align.copy().smith_waterman(mod_len, band=band)
+        assert align.sum_pairs_scores(OBJECTIVES) == fresh(align).sum_pairs_scores(OBJECTIVES)
+
+
+def test_profile_matches_recount(align):
+    rnd.seed(3)
+    align.sum_pairs_scores(OBJECTIVES)
+    for mod_len in (0.5, 0.25, 0.125) * 5:
+        align = align.copy().smith_waterman(mod_len, band='auto', compact=mod_len < 0.5)
+
+        # only the edited blocks are rebuilt, the profile still counts every column
+        assert np.array_equal(align._profile.array(), column_profile(align.seqs))
+
+
+def test_compact_keeps_scores(align):
+    rnd.seed(1)
+    for _ in range(10):
+        align = align.copy().smith_waterman(0.25, compact=False)
+    scores = align.sum_pairs_scores(OBJECTIVES)
+    dropped = align.compact()
+    assert dropped > 0 and align.gap_columns == dropped
+    assert align.sum_pairs_scores(OBJECTIVES) == scores == fresh(align).sum_pairs_scores(OBJECTIVES)
+
+
+def test_unpickled_edits(align):
+    rnd.seed(2)
+    np.random.seed(2)
+    align.sum_pairs_scores(OBJECTIVES)
+
+    # a child of an unpickled parent has no profile, its scores are counted again
+    for _ in range(5):
+        child = pickle.loads(pickle.dumps(align)).smith_waterman(0.25)
+        exact = fresh(child).sum_pairs_scores(OBJECTIVES)
+        estimates, bounds = child.estimate_scores(OBJECTIVES, rate=1.0)
+        assert np.allclose(estimates, exact) and not bounds.any()
+        assert child.sum_pairs_scores(OBJECTIVES) == exact
+
+        # counting it dropped the all-gap columns the edit left, keeping the scores
+        assert (child.seqs != 0).any(axis=0).all()
+        assert fresh(child).sum_pairs_scores(OBJECTIVES) == exact
+        align = child
+
+
+def test_sampled_estimates(align):
+    rnd.seed(1)
+    np.random.seed(1)
+    align = many_rows(align, 120, 1)
+    align.sum_pairs_scores(OBJECTIVES)
+
+    # 30 of the 118 other rows are sampled, the bounds are a normal approximation so they cover
+    # the exact scores somewhat less often than the confidence asks for
+    covered, bounded = [], 0
+    for _ in range(30):
+        child = pickle.loads(pickle.dumps(align)).smith_waterman(0.25)
+        exact = np.array(fresh(child).sum_pairs_scores(OBJECTIVES))
+        estimates, bounds = child.estimate_scores(OBJECTIVES, rate=0.2, confidence=0.9)
+        assert np.allclose(estimates, exact, rtol=0.05)
+        covered += list(np.abs(estimates - exact) <= bounds)
+        bounded += bool(bounds.any())
+    assert bounded >= 25 and np.mean(covered) >= 0.75
@@ -0,0 +1,48 @@
+"""
+Checkpoint directories shared by runs with different objectives
+"""
+import os
+import io
+import contextlib
+from EvoAlign import EvoAlign
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data', 'dash.fasta')
+
+
+def run(objectives, checkpoint):
+    """ Short seeded run syncing with a checkpoint directory """
+    evo_align = EvoAlign(objectives)
+    evo_align.read_fasta(DATA)
+    with contextlib.redirect_stdout(io.StringIO()):
+        evo_align.align(gens=20, status=None, seed=0, checkpoint=checkpoint)
+    return evo_align.Evo
+
+
+def test_other_objectives_are_skipped(tmp_path):
+    path = str(tmp_path / 'checkpoint')
+    first = run(None, path)
+    second = run({'b45': 45, 'b62': 62}, path)
+    assert second.pop.names == ('b45', 'b62')
+
+    # both fronts are kept and a run with the first objectives still resumes from its own
+    third = run(None, path)
+    assert third.pop.names == first.pop.names
+    assert second.size() and third.size()
+
+
+def test_resume_empty_population(tmp_path):
+    path = str(tmp_path / 'checkpoint')
+    run({'b45': 45, 'b62': 62}, path)
+
+    # an empty population only resumes from the solutions scored on its own objectives
+    evo_align = EvoAlign()
+    evo_align.read_fasta(DATA)
+    evo_align.Evo.resume(path)
+    assert evo_align.Evo.size() == 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        evo_align.align(gens=10, status=None, seed=0, checkpoint=path)
+
+    first = run(None, path)
+    evo_align = EvoAlign()
+    evo_align.Evo.resume(path)
+    assert evo_align.Evo.size() and evo_align.Evo.pop.names == first.pop.names
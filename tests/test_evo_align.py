@@ -0,0 +1,60 @@
+"""
+Seeded EvoAlign runs
+"""
+import os
+import io
+import pickle
+import contextlib
+from EvoAlign import EvoAlign, BanditScheduler
+from EvoAlign.evo import _screen
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data', 'dash.fasta')
+
+
+def front(seed, **options):
+    """ Objectives of the front of a short seeded run """
+    evo_align = EvoAlign()
+    evo_align.read_fasta(DATA)
+    with contextlib.redirect_stdout(io.StringIO()):
+        evo_align.align(gens=40, status=None, seed=seed, **options)
+    assert isinstance(evo_align.Evo.scheduler, BanditScheduler)
+    return sorted(evo_align.Evo.pop.objs.tolist())
+
+
+def test_seeded_runs_repeat():
+    assert front(7) == front(7)
+
+
+def test_exact_estimates_are_not_screened():
+    # offspring edited in the main process keep their counts, their estimates are the exact scores
+    evo_align = EvoAlign()
+    evo_align.read_fasta(DATA)
+    with contextlib.redirect_stdout(io.StringIO()):
+        evo_align.align(gens=20, status=None, seed=0, screen=0.05)
+    assert 'screen' not in evo_align.Evo.metrics.stages
+
+
+def test_serial_runs_every_generation():
+    # batch only groups the agents of worker processes, a serial run still runs one agent per generation
+    evo_align = EvoAlign()
+    evo_align.read_fasta(DATA)
+    with contextlib.redirect_stdout(io.StringIO()):
+        evo_align.align(gens=40, batch=8, status=None, seed=1)
+    assert sum(entry['calls'] for entry in evo_align.Evo.metrics.agents.values()) == 40
+
+
+def test_workers_screen_dominated():
+    evo_align = EvoAlign()
+    evo_align.read_fasta(DATA)
+    with contextlib.redirect_stdout(io.StringIO()):
+        evo_align.align(gens=30, status=None, seed=0, workers=2, screen=0.05)
+    screen = evo_align.Evo.metrics.stages['screen']
+    assert 0 < screen['dropped'] <= screen['calls']
+
+    # a child edited without cached counts is dropped by a front confidently above it, and kept under one below it
+    evo = evo_align.Evo
+    child = pickle.loads(pickle.dumps(evo.pop.values()[0])).smith_waterman(0.25)
+    estimates, bounds = evo.fitness['blosum_62_score'].estimate(child, 0.05, 0.99)
+    assert bounds.any()
+    assert _screen(evo.fitness, child, (estimates + 2 * bounds + 1)[None], 0.05, 0.99)
+    assert not _screen(evo.fitness, child, (estimates - 2 * bounds - 1)[None], 0.05, 0.99)
@@ -0,0 +1,49 @@
+"""
+Sum of pairs scores of the column profiles against the original pairwise loop
+"""
+import numpy as np
+import pytest
+from EvoAlign import Align
+from EvoAlign.evo_align import MATRICES
+from EvoAlign.scoring import encode
+
+# residues the random alignments are drawn from, gaps included
+RESIDUES = np.array(list('ARNDCQEGHILKMFPSTWYV*'))
+
+
+def pairwise_score(seqs, matrix):
+    """ Unrounded score of the original implementation: every pair of rows in every column """
+    score = 0
+    for pos in seqs.T[::-1]:
+        score += sum([matrix[x + y] for i, x in enumerate(pos) for j, y in enumerate(pos) if i > j])
+    return score
+
+
+def random_align(rng, n, width):
+    """ Alignment of n random rows of width characters """
+    align = Align()
+    align.seqs = encode(rng.choice(RESIDUES, (n, width)))
+    return align
+
+
+@pytest.mark.parametrize('name', [45, 62, 'HYDRO', 'VOL'])
+def test_matches_pairwise_loop(name):
+    rng = np.random.default_rng(0)
+    matrix = MATRICES[name]
+    for _ in range(20):
+        align = random_align(rng, int(rng.integers(2, 9)), int(rng.integers(1, 40)))
+        raw = pairwise_score(align.get_seqs(), matrix)
+
+        # the same integer, except on exact .5 ties the float loop could round either way
+        score = align.sum_pairs_score(matrix)
+        assert abs(score - raw) <= 0.5 + 1e-6
+        if abs(abs(raw % 1) - 0.5) > 1e-6:
+            assert score == round(raw)
+
+
+def test_scores_of_several_matrices():
+    rng = np.random.default_rng(1)
+    align = random_align(rng, 6, 30)
+    matrices = list(MATRICES.values())
+    assert align.sum_pairs_scores(matrices) == tuple(align.sum_pairs_score(matrix) for matrix in matrices)
+    assert Align.score_population([align, align.copy()], matrices).tolist() == [list(align.sum_pairs_scores(matrices))] * 2
@@ -0,0 +1,68 @@
+"""
+Vectorized, checkpointed and banded Smith-Waterman kernels against the original cell-by-cell recurrence
+"""
+import blosum as bl
+import numpy as np
+import pytest
+from EvoAlign.scoring import dense_matrix, encode
+from EvoAlign.smith_waterman import (DELETION, INSERTION, MATCH, align_checkpointed, align_segments, fill,
+                                     fill_banded, traceback, traceback_banded)
+
+BLOSUM62 = bl.BLOSUM(62)
+
+
+def reference(seq1, seq2, insertion_penalty=-1, deletion_penalty=-1, mismatch_penalty=-1, match_score=2,
+              matrix=None):
+    """ Original recurrence: one cell at a time, ties broken by the (score, direction) tuple max """
+
+    dense = dense_matrix(matrix) if matrix is not None else None
+    m, n = len(seq1), len(seq2)
+    p = np.zeros((m + 1, n + 1))
+    q = np.zeros((m + 1, n + 1), dtype=np.uint8)
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            if dense is not None:
+                score = dense[seq1[i - 1], seq2[j - 1]]
+            else:
+                score = match_score if seq1[i - 1] == seq2[j - 1] else mismatch_penalty
+            deletion = (p[i - 1][j] + deletion_penalty, DELETION)
+            insertion = (p[i][j - 1] + insertion_penalty, INSERTION)
+            match = (p[i - 1][j - 1] + score, MATCH)
+            p[i][j], q[i][j] = max((0, 0), deletion, insertion, match)
+    return p, q
+
+
+def segments(seed, count=30):
+    """ Random segment pairs over a small alphabet (many ties), some of them empty or with gaps """
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        seq1 = encode(''.join(rng.choice(list('ACG*'), int(rng.integers(0, 25)))))
+        seq2 = encode(''.join(rng.choice(list('ACG*'), int(rng.integers(0, 25)))))
+        yield seq1, seq2
+
+
+@pytest.mark.parametrize('matrix', [None, BLOSUM62])
+def test_fill_matches_recurrence(matrix):
+    for seq1, seq2 in segments(0):
+        p, q = fill(seq1, seq2, matrix=matrix)
+        p_ref, q_ref = reference(seq1, seq2, matrix=matrix)
+        assert np.array_equal(p, p_ref)
+        assert np.array_equal(q[1:, 1:], q_ref[1:, 1:])
+
+
+@pytest.mark.parametrize('matrix', [None, BLOSUM62])
+def test_alignments_match_recurrence(matrix):
+    for seq1, seq2 in segments(1):
+        expected = traceback(reference(seq1, seq2, matrix=matrix)[1], seq1, seq2)
+
+        # full matrix, checkpointed traceback at several block sizes, and a band covering the whole matrix
+        results = [align_segments(seq1, seq2, matrix=matrix),
+                   align_segments(seq1, seq2, matrix=matrix, max_cells=0)]
+        results += [align_checkpointed(seq1, seq2, matrix=matrix, step=step) for step in (1, 2, 5)]
+        band = max(len(seq1), len(seq2)) + 1
+        results.append(traceback_banded(fill_banded(seq1, seq2, band, matrix=matrix), seq1, seq2, band)[:2])
+
+        for aligned1, aligned2 in results:
+            assert np.array_equal(aligned1, expected[0])
+            assert np.array_equal(aligned2, expected[1])
+